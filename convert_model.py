@@ -1,51 +1,243 @@
 import tensorflow as tf
 import os
+import json
+import argparse
+import numpy as np
 
 # Path to your model
 original_model_path = "mri_brain_tumor_model-keras-default-v1/model.h5"
 new_model_path = "mri_brain_tumor_model-keras-default-v1/model_converted.h5"
 
-# Load and immediately save the model with the current TensorFlow version
-try:
-    # Try to load with standard loading
-    model = tf.keras.models.load_model(original_model_path, compile=False)
-    
-    # Print model summary
-    model.summary()
-    
-    # Save the model in the current format
-    model.save(new_model_path)
-    print(f"Model successfully converted and saved to {new_model_path}")
-except Exception as e:
-    print(f"Error converting model: {e}")
-    
-    # Advanced loading attempt
+# Class order used by the ML service
+class_names = ["meningioma", "glioma", "pituitary", "no_tumor"]
+
+# Quantized variants that can be produced
+QUANTIZED_VARIANTS = ["dynamic", "int8", "float16"]
+
+# Share of the calibration images held out to measure accuracy
+EVAL_FRACTION = 0.3
+
+def convert_model():
+    """Load and immediately save the model with the current TensorFlow version."""
     try:
-        print("Attempting advanced loading...")
-        # Try with custom objects
-        from tensorflow.keras.models import model_from_json
-        
-        # Extract architecture and weights separately
-        with tf.io.gfile.GFile(original_model_path, 'rb') as f:
-            model_content = f.read()
-        
-        import h5py
-        with h5py.File(original_model_path, 'r') as f:
-            if 'model_config' in f.attrs:
-                # Get the model architecture
-                model_config = f.attrs['model_config']
-                
-                # Create model from config
-                from tensorflow.keras.models import model_from_json
-                model = model_from_json(model_config.decode('utf-8'))
-                
-                # Load weights
-                model.load_weights(original_model_path)
-                
-                # Save in the current format
-                model.save(new_model_path)
-                print(f"Model successfully converted using advanced method and saved to {new_model_path}")
-            else:
-                print("Could not extract model architecture from H5 file")
-    except Exception as e2:
-        print(f"Advanced conversion failed: {e2}")
+        # Try to load with standard loading
+        model = tf.keras.models.load_model(original_model_path, compile=False)
+
+        # Print model summary
+        model.summary()
+
+        # Save the model in the current format
+        model.save(new_model_path)
+        print(f"Model successfully converted and saved to {new_model_path}")
+    except Exception as e:
+        print(f"Error converting model: {e}")
+
+        # Advanced loading attempt
+        try:
+            print("Attempting advanced loading...")
+            # Try with custom objects
+            from tensorflow.keras.models import model_from_json
+
+            import h5py
+            with h5py.File(original_model_path, 'r') as f:
+                if 'model_config' in f.attrs:
+                    # Get the model architecture
+                    model_config = f.attrs['model_config']
+
+                    # Create model from config
+                    model = model_from_json(model_config.decode('utf-8'))
+
+                    # Load weights
+                    model.load_weights(original_model_path)
+
+                    # Save in the current format
+                    model.save(new_model_path)
+                    print(f"Model successfully converted using advanced method and saved to {new_model_path}")
+                else:
+                    print("Could not extract model architecture from H5 file")
+        except Exception as e2:
+            print(f"Advanced conversion failed: {e2}")
+
+def load_image(path):
+    """Preprocess an image exactly like the ML service does."""
+    import cv2
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    img = cv2.resize(img, (224, 224))
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return img.astype(np.float32) / 255.0
+
+def load_calibration_set(calibration_dir):
+    """
+    Load labelled sample MRIs from `<calibration_dir>/<class_name>/*`.
+
+    Returns the preprocessed images and their class indices.
+    """
+    images, labels = [], []
+    for class_index, class_name in enumerate(class_names):
+        class_dir = os.path.join(calibration_dir, class_name)
+        if not os.path.isdir(class_dir):
+            print(f"Warning: no calibration images for {class_name} ({class_dir} missing)")
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            img = load_image(os.path.join(class_dir, filename))
+            if img is not None:
+                images.append(img)
+                labels.append(class_index)
+
+    if not images:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+
+    print(f"Loaded {len(images)} calibration images")
+    return np.stack(images), np.array(labels)
+
+def split_calibration_set(images, labels, eval_fraction=EVAL_FRACTION, seed=0):
+    """
+    Split labelled images into a calibration part and a held-out evaluation part.
+
+    The split is stratified by class, so every class with at least two images
+    appears in both parts. Returns (calibration images, evaluation images,
+    evaluation labels).
+    """
+    rng = np.random.default_rng(seed)
+    calibration_indices, eval_indices = [], []
+    for class_index in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == class_index))
+        held_out = int(round(len(indices) * eval_fraction))
+        if len(indices) > 1:
+            held_out = min(max(held_out, 1), len(indices) - 1)
+        eval_indices.extend(indices[:held_out])
+        calibration_indices.extend(indices[held_out:])
+
+    if not eval_indices or not calibration_indices:
+        raise ValueError("Not enough calibration images to hold out an evaluation set")
+
+    calibration_indices = np.sort(calibration_indices)
+    eval_indices = np.sort(eval_indices)
+    print(f"Using {len(calibration_indices)} images for calibration and {len(eval_indices)} for evaluation")
+    return images[calibration_indices], images[eval_indices], labels[eval_indices]
+
+def quantize_model(model, variant, calibration_images):
+    """Convert a Keras model to a quantized TFLite flatbuffer."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if variant == "float16":
+        # Weights stored as float16, computed in float32
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        # Weights and activations in int8, calibrated on sample MRIs; float I/O is kept
+        def representative_dataset():
+            for img in calibration_images[:200]:
+                yield [img[np.newaxis, ...]]
+        converter.representative_dataset = representative_dataset
+    # "dynamic": weights in int8, activations quantized on the fly
+
+    return converter.convert()
+
+def run_tflite(model_content, images, batch_size=16):
+    """Run a TFLite model over a set of images and return the class scores."""
+    interpreter = tf.lite.Interpreter(model_content=model_content)
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+
+    outputs = []
+    for start in range(0, len(images), batch_size):
+        batch = images[start:start + batch_size]
+        interpreter.resize_tensor_input(input_detail["index"], list(batch.shape))
+        interpreter.allocate_tensors()
+        interpreter.set_tensor(input_detail["index"], batch)
+        interpreter.invoke()
+        outputs.append(interpreter.get_tensor(output_detail["index"]))
+    return np.concatenate(outputs)
+
+def per_class_accuracy(predictions, labels):
+    """Return top-1 accuracy for each class present in `labels`."""
+    predicted = np.argmax(predictions, axis=1)
+    accuracy = {}
+    for class_index, class_name in enumerate(class_names):
+        mask = labels == class_index
+        if mask.any():
+            accuracy[class_name] = float(np.mean(predicted[mask] == class_index))
+    accuracy["overall"] = float(np.mean(predicted == labels))
+    return accuracy
+
+def quantize(model_path, calibration_dir, variants, output_dir, eval_dir=None, eval_fraction=EVAL_FRACTION, seed=0):
+    """
+    Produce quantized variants and report per-class accuracy deltas against float32.
+
+    Accuracy is measured on images the int8 calibration never saw: `eval_dir`
+    when given, otherwise a held-out split of `calibration_dir`.
+    """
+    model = tf.keras.models.load_model(model_path, compile=False)
+    images, labels = load_calibration_set(calibration_dir)
+    if eval_dir:
+        calibration_images = images
+        images, labels = load_calibration_set(eval_dir)
+    else:
+        calibration_images, images, labels = split_calibration_set(images, labels, eval_fraction, seed)
+
+    baseline_predictions = model.predict(images, verbose=0)
+    baseline = per_class_accuracy(baseline_predictions, labels)
+    report = {
+        "calibration_images": len(calibration_images),
+        "eval_images": len(images),
+        "float32": {"accuracy": baseline}
+    }
+    print(f"float32 accuracy: {baseline}")
+
+    base_name = os.path.splitext(os.path.basename(model_path))[0]
+    for variant in variants:
+        model_content = quantize_model(model, variant, calibration_images)
+        output_path = os.path.join(output_dir, f"{base_name}_{variant}.tflite")
+        with open(output_path, "wb") as f:
+            f.write(model_content)
+
+        predictions = run_tflite(model_content, images)
+        accuracy = per_class_accuracy(predictions, labels)
+        agreement = float(np.mean(np.argmax(predictions, axis=1) == np.argmax(baseline_predictions, axis=1)))
+
+        report[variant] = {
+            "path": output_path,
+            "size_bytes": len(model_content),
+            "accuracy": accuracy,
+            "accuracy_delta": {name: accuracy[name] - baseline[name] for name in accuracy},
+            "agreement_with_float32": agreement
+        }
+        print(f"{variant}: {len(model_content) / (1024*1024):.2f} MB saved to {output_path}")
+        for name in accuracy:
+            print(f"  {name}: {accuracy[name]*100:.2f}% ({(accuracy[name] - baseline[name])*100:+.2f} pts)")
+        print(f"  top-class agreement with float32: {agreement*100:.2f}%")
+
+    report_path = os.path.join(output_dir, f"{base_name}_quantization_report.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Quantization report saved to {report_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert or quantize the tumor classifier")
+    parser.add_argument("--quantize", action="store_true", help="Produce quantized TFLite variants instead of re-saving the model")
+    parser.add_argument("--model", default=original_model_path, help="Path to the float32 Keras model")
+    parser.add_argument("--calibration-dir", help="Directory with one sub-directory of sample MRIs per class")
+    parser.add_argument("--eval-dir", help="Directory of held-out MRIs (same layout) to measure accuracy on; default: a split of --calibration-dir")
+    parser.add_argument("--eval-fraction", type=float, default=EVAL_FRACTION, help="Share of --calibration-dir held out for evaluation when --eval-dir is not given")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the calibration/evaluation split")
+    parser.add_argument("--variants", default=",".join(QUANTIZED_VARIANTS), help="Comma-separated variants to build")
+    parser.add_argument("--output-dir", default=None, help="Directory for quantized models (default: next to the model)")
+    args = parser.parse_args()
+
+    if not args.quantize:
+        convert_model()
+    else:
+        if not args.calibration_dir:
+            parser.error("--calibration-dir is required with --quantize")
+        if not args.eval_dir and not 0 < args.eval_fraction < 1:
+            parser.error("--eval-fraction must be between 0 and 1")
+        variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+        unknown = set(variants) - set(QUANTIZED_VARIANTS)
+        if unknown:
+            parser.error(f"Unknown variants: {', '.join(sorted(unknown))}")
+        output_dir = args.output_dir or os.path.dirname(args.model)
+        os.makedirs(output_dir, exist_ok=True)
+        quantize(args.model, args.calibration_dir, variants, output_dir, args.eval_dir, args.eval_fraction, args.seed)
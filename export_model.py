@@ -0,0 +1,90 @@
+import os
+import argparse
+import numpy as np
+import tensorflow as tf
+
+# Path to your model
+DEFAULT_MODEL_PATH = "mri_brain_tumor_model-keras-default-v1/model.h5"
+
+# Largest acceptable difference in class scores between Keras and the export
+PARITY_TOLERANCE = 1e-3
+
+def export_tflite(model, output_path):
+    """Export a float32 TFLite model."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    tflite_model = converter.convert()
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    print(f"TFLite model saved to {output_path} ({len(tflite_model) / (1024*1024):.2f} MB)")
+
+def export_onnx(model, output_path):
+    """Export an ONNX model with a dynamic batch dimension."""
+    try:
+        import tf2onnx
+    except ImportError:
+        print("Skipping ONNX export: install tf2onnx to enable it")
+        return False
+
+    spec = (tf.TensorSpec((None, 224, 224, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=output_path)
+    print(f"ONNX model saved to {output_path} ({os.path.getsize(output_path) / (1024*1024):.2f} MB)")
+    return True
+
+def run_tflite(model_path, batch):
+    interpreter = tf.lite.Interpreter(model_path=model_path)
+    input_detail = interpreter.get_input_details()[0]
+    output_detail = interpreter.get_output_details()[0]
+    interpreter.resize_tensor_input(input_detail["index"], list(batch.shape))
+    interpreter.allocate_tensors()
+    interpreter.set_tensor(input_detail["index"], batch)
+    interpreter.invoke()
+    return interpreter.get_tensor(output_detail["index"])
+
+def run_onnx(model_path, batch):
+    import onnxruntime as ort
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    return session.run(None, {session.get_inputs()[0].name: batch})[0]
+
+def report_parity(name, expected, actual):
+    """Print and return whether an export matches the Keras output."""
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+    agreement = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+    passed = max_abs_diff <= PARITY_TOLERANCE and agreement == 1.0
+    print(f"{name}: max abs diff {max_abs_diff:.6f}, top-class agreement {agreement*100:.1f}% -> "
+          f"{'OK' if passed else 'MISMATCH'}")
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Keras classifier to ONNX and TFLite")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Path to the Keras .h5 model")
+    parser.add_argument("--output-dir", default=None, help="Directory for exported models (default: next to the model)")
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or os.path.dirname(args.model)
+    os.makedirs(output_dir, exist_ok=True)
+    base_name = os.path.splitext(os.path.basename(args.model))[0]
+    tflite_path = os.path.join(output_dir, f"{base_name}.tflite")
+    onnx_path = os.path.join(output_dir, f"{base_name}.onnx")
+
+    print(f"Loading model from {args.model}")
+    model = tf.keras.models.load_model(args.model, compile=False)
+
+    export_tflite(model, tflite_path)
+    onnx_exported = export_onnx(model, onnx_path)
+
+    # Parity check on a fixed pseudo-random batch
+    batch = np.random.RandomState(0).uniform(0.0, 1.0, (4, 224, 224, 3)).astype(np.float32)
+    expected = model.predict(batch, verbose=0)
+
+    passed = report_parity("tflite", expected, run_tflite(tflite_path, batch))
+    if onnx_exported:
+        try:
+            passed = report_parity("onnx", expected, run_onnx(onnx_path, batch)) and passed
+        except ImportError:
+            print("Skipping ONNX parity check: install onnxruntime to enable it")
+
+    if not passed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,82 @@
 import os
 import shutil
+import logging
+from functools import partial
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from app.api.deps import get_current_user, get_db
 from app.core.config import settings
-from app.schemas.analysis import AnalysisCreate, AnalysisResponse, AnalysisUpdate
+from app.schemas.analysis import AnalysisCreate, AnalysisResponse, AnalysisStatus, AnalysisUpdate
 from app.schemas.user import User
 from app.services.analysis_service import AnalysisService
-from app.services.ml_service import MLService
+from app.services.job_queue import job_queue, dependency_context, JobQueueFullError, INTERRUPTED_MESSAGE
+from app.services.analysis_events import broker, event_stream_response
+from app.services.ml_service import analyze_image_file
+from app.utils.executor import inference_executor
 
 router = APIRouter()
-ml_service = MLService()
 
-@router.post("/", response_model=AnalysisResponse, status_code=status.HTTP_201_CREATED)
+logger = logging.getLogger(__name__)
+
+def _save_upload(source, file_location):
+    """Copy an uploaded file to disk."""
+    with open(file_location, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+async def _fail_analysis_job(analysis_id: str, message: str):
+    """
+    Record a failed job and publish FAILED, even if the record cannot be updated
+    """
+    try:
+        with dependency_context(get_db) as db:
+            await run_in_threadpool(AnalysisService(db).fail_analysis, analysis_id, message)
+    except Exception as e:
+        logger.error(f"Error recording failure of analysis {analysis_id}: {str(e)}")
+    broker.publish(analysis_id, AnalysisStatus.FAILED, message=message)
+
+async def _run_analysis_job(analysis_id: str, file_location: str):
+    """
+    Background job: run the ML model for an analysis and record the outcome
+    """
+    try:
+        with dependency_context(get_db) as db:
+            analysis_service = AnalysisService(db)
+            await run_in_threadpool(analysis_service.mark_processing, analysis_id)
+            broker.publish(analysis_id, AnalysisStatus.PROCESSING)
+            
+            result = await inference_executor.run(analyze_image_file, file_location, bounded=False)
+            processed_analysis = await run_in_threadpool(
+                analysis_service.complete_analysis, analysis_id, file_location, result
+            )
+    except Exception as e:
+        # Cleanup in case of error, keeping the record so clients see the failure
+        try:
+            if os.path.exists(file_location):
+                os.remove(file_location)
+        except OSError as cleanup_error:
+            logger.error(f"Error deleting file {file_location}: {str(cleanup_error)}")
+        await _fail_analysis_job(analysis_id, f"Error processing analysis: {str(e)}")
+        return
+    
+    broker.publish(analysis_id, AnalysisStatus.COMPLETED, analysis=processed_analysis.dict())
+
+@job_queue.on_recover
+async def _recover_analysis_jobs() -> int:
+    """
+    Fail the analyses a previous process queued or started but never finished
+    """
+    with dependency_context(get_db) as db:
+        analysis_ids = await run_in_threadpool(
+            AnalysisService(db).fail_unfinished_analyses, INTERRUPTED_MESSAGE
+        )
+    for analysis_id in analysis_ids:
+        broker.publish(analysis_id, AnalysisStatus.FAILED, message=INTERRUPTED_MESSAGE)
+    return len(analysis_ids)
+
+@router.post("/", response_model=AnalysisResponse, status_code=status.HTTP_202_ACCEPTED)
 async def create_analysis(
     file: UploadFile = File(...),
     note: Optional[str] = Form(None),
@@ -22,7 +84,8 @@ async def create_analysis(
     db: Session = Depends(get_db)
 ):
     """
-    Create a new brain MRI scan analysis
+    Create a new brain MRI scan analysis.
+    The analysis is queued and returned as pending; poll GET /{analysis_id} for the result.
     """
     # Check if the file is an image
     if not file.content_type.startswith("image/"):
@@ -31,6 +94,12 @@ async def create_analysis(
             detail="File provided is not an image"
         )
     
+    if job_queue.full():
+        raise HTTPException(
+            status_code=503,
+            detail="Analysis queue is full, please retry shortly"
+        )
+    
     # Create uploads directory if it doesn't exist
     uploads_dir = os.path.join(settings.UPLOAD_DIR)
     os.makedirs(uploads_dir, exist_ok=True)
@@ -44,22 +113,22 @@ async def create_analysis(
     
     # Save the file
     file_location = os.path.join(uploads_dir, f"{analysis.id}.jpg")
-    with open(file_location, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    await run_in_threadpool(_save_upload, file.file, file_location)
     
-    # Process the analysis
+    # Queue the analysis
     try:
-        processed_analysis = analysis_service.process_analysis(analysis.id, file_location)
-        return processed_analysis
-    except Exception as e:
-        # Cleanup in case of error
+        job_queue.submit(analysis.id, partial(_run_analysis_job, analysis.id, file_location))
+        broker.publish(analysis.id, AnalysisStatus.PENDING)
+    except JobQueueFullError:
         if os.path.exists(file_location):
             os.remove(file_location)
         analysis_service.delete_analysis(analysis.id)
         raise HTTPException(
-            status_code=500,
-            detail=f"Error processing analysis: {str(e)}"
+            status_code=503,
+            detail="Analysis queue is full, please retry shortly"
         )
+    
+    return analysis_service.get_analysis_by_id(analysis.id)
 
 @router.get("/{analysis_id}", response_model=AnalysisResponse)
 def get_analysis(
@@ -88,6 +157,39 @@ def get_analysis(
     
     return analysis
 
+@router.get("/{analysis_id}/events")
+def get_analysis_events(
+    analysis_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-sent events stream of status transitions for an analysis
+    """
+    analysis_service = AnalysisService(db)
+    analysis = analysis_service.get_analysis_by_id(analysis_id)
+    
+    if not analysis:
+        raise HTTPException(
+            status_code=404,
+            detail="Analysis not found"
+        )
+    
+    # Check if the user owns this analysis
+    if analysis.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403,
+            detail="Not authorized to access this analysis"
+        )
+    
+    # The stored state is only used if no worker event has been seen yet
+    initial = {
+        "analysis_id": analysis_id,
+        "status": AnalysisStatus(analysis.status).value,
+        "analysis": analysis.dict()
+    }
+    return event_stream_response(analysis_id, initial)
+
 @router.get("/", response_model=List[AnalysisResponse])
 def get_user_analyses(
     skip: int = 0,
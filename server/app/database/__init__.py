@@ -1,8 +1,138 @@
 import os
+import time
+import logging
+import threading
 import motor.motor_asyncio
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 from pymongo.collection import Collection
 
+from app.utils.metrics import Histogram, LATENCY_MS_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+def _optional_int(name):
+    """Integer setting that falls back to the driver default when unset or empty."""
+    value = os.environ.get(name, "")
+    return int(value) if value else None
+
+# Connection pool settings (unset ones use the driver defaults)
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", 100))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0))
+MONGODB_MAX_IDLE_TIME_MS = _optional_int("MONGODB_MAX_IDLE_TIME_MS")
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = _optional_int("MONGODB_WAIT_QUEUE_TIMEOUT_MS")
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", 20000))
+MONGODB_SOCKET_TIMEOUT_MS = _optional_int("MONGODB_SOCKET_TIMEOUT_MS")
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 30000))
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener that tracks utilisation and checkout wait time.
+
+    Keeps open and checked-out connection counts per server and a histogram
+    of how long operations waited for a connection, so an undersized pool
+    shows up as wait time rather than as unexplained request latency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+        # Driver calls run on Motor's worker threads, so checkout start times are per thread
+        self._local = threading.local()
+        self._counters = {"checkouts": 0, "checkout_failures": 0, "pool_clears": 0}
+        self.wait_histogram = Histogram(LATENCY_MS_BUCKETS)
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools.setdefault(key, {"open": 0, "checked_out": 0})
+        return pool
+
+    def _adjust(self, address, field, delta):
+        with self._lock:
+            pool = self._pool(address)
+            pool[field] = max(0, pool[field] + delta)
+
+    def _observe_wait(self, event):
+        # PyMongo 4.7+ reports the wait itself; older drivers are timed from check_out_started
+        duration = getattr(event, "duration", None)
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        if duration is None and started is not None:
+            duration = time.perf_counter() - started
+        if duration is not None:
+            self.wait_histogram.observe(duration * 1000)
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._counters["pool_clears"] += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._adjust(event.address, "open", 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._adjust(event.address, "open", -1)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._observe_wait(event)
+        with self._lock:
+            self._counters["checkout_failures"] += 1
+        logger.warning(f"MongoDB connection checkout failed for {event.address[0]}:{event.address[1]}: {event.reason}")
+
+    def connection_checked_out(self, event):
+        self._observe_wait(event)
+        with self._lock:
+            self._counters["checkouts"] += 1
+            self._pool(event.address)["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self._adjust(event.address, "checked_out", -1)
+
+    def connections(self):
+        """Return (address, open, checked out) for every pool."""
+        with self._lock:
+            return [(address, pool["open"], pool["checked_out"]) for address, pool in self._pools.items()]
+
+    def stats(self):
+        """Return pool settings, per-server connection counts and the checkout wait histogram."""
+        with self._lock:
+            pools = {address: dict(pool) for address, pool in self._pools.items()}
+            counters = dict(self._counters)
+        return {
+            "max_pool_size": MONGODB_MAX_POOL_SIZE,
+            "min_pool_size": MONGODB_MIN_POOL_SIZE,
+            "pools": pools,
+            **counters,
+            "wait_ms": self.wait_histogram.snapshot()
+        }
+
+# Shared listener for the service's MongoDB client
+pool_monitor = PoolMonitor()
+registry.gauge("mongodb_pool_connections", "MongoDB connections per server, open or checked out", lambda: [
+    ({"address": address, "state": state}, count)
+    for address, open_count, checked_out in pool_monitor.connections()
+    for state, count in (("open", open_count), ("checked_out", checked_out))
+])
+registry.gauge("mongodb_pool_max_size", "Maximum MongoDB connections per server", lambda: MONGODB_MAX_POOL_SIZE)
+registry.histogram("mongodb_checkout_wait_ms", "Time operations waited for a MongoDB connection in milliseconds").attach(pool_monitor.wait_histogram)
+
 # MongoDB client
 client = None
 db = None
@@ -10,24 +140,78 @@ db = None
 # Collections
 users_collection = None
 analyses_collection = None
+# Uploads kept by /analyze?persist=true; each record holds one blob store reference
+scans_collection = None
+
+def client_options():
+    """Keyword arguments for the Motor client, from the MONGODB_* settings."""
+    options = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "connectTimeoutMS": MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "socketTimeoutMS": MONGODB_SOCKET_TIMEOUT_MS,
+        "event_listeners": [pool_monitor]
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+async def ensure_index(collection, keys, unique=False):
+    """
+    Create an index unless an equivalent one already exists
+
+    Checking `index_information` first is a cheap read, whereas re-issuing
+    `create_index` on every boot takes a lock on each collection.
+
+    Returns:
+        True if the index was created
+    """
+    key = [(keys, 1)] if isinstance(keys, str) else list(keys)
+    for info in (await collection.index_information()).values():
+        if [tuple(part) for part in info["key"]] == key and bool(info.get("unique", False)) == unique:
+            return False
+    await collection.create_index(key, unique=unique)
+    return True
+
+async def ensure_indexes():
+    """Create the indexes the service queries by, if missing."""
+    created = [
+        await ensure_index(users_collection, "email", unique=True),
+        await ensure_index(analyses_collection, "user_id"),
+        # Startup recovery looks for analyses left pending or processing
+        await ensure_index(analyses_collection, "status"),
+        await ensure_index(scans_collection, "blob_id")
+    ]
+    if any(created):
+        logger.info(f"Created {sum(created)} MongoDB indexes")
 
 async def init_db():
-    global client, db, users_collection, analyses_collection
-    
+    global client, db, users_collection, analyses_collection, scans_collection
+
     mongodb_uri = os.environ.get("MONGODB_URI")
     if not mongodb_uri:
         raise ValueError("MONGODB_URI environment variable not set")
-    
+
     # Create Motor client
-    client = motor.motor_asyncio.AsyncIOMotorClient(mongodb_uri)
+    client = motor.motor_asyncio.AsyncIOMotorClient(mongodb_uri, **client_options())
     db = client.cerebroai
-    
+
     # Initialize collections
     users_collection = db.users
     analyses_collection = db.analyses
-    
+    scans_collection = db.scans
+
     # Create indices
-    await users_collection.create_index("email", unique=True)
-    await analyses_collection.create_index("user_id")
-    
-    print("Connected to MongoDB Atlas") 
\ No newline at end of file
+    await ensure_indexes()
+
+    print("Connected to MongoDB Atlas")
+
+async def close_db():
+    """Close the client and its connection pool; call after the background tasks using it have stopped."""
+    global client, db, users_collection, analyses_collection, scans_collection
+
+    if client is not None:
+        client.close()
+        logger.info("Closed MongoDB connection pool")
+    client = db = users_collection = analyses_collection = scans_collection = None
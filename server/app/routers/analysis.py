@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
+from functools import partial
 from typing import List, Optional
 from uuid import UUID, uuid4
 import os
-import shutil
+import logging
 from datetime import datetime
 
 from app.schemas.analysis import (
@@ -14,16 +16,109 @@ from app.schemas.analysis import (
     AnalysisStatus,
     PredictionResult
 )
-from app.services.ml_service import MLService
+from app.services.ml_service import analyze_image_file
+from app.services.job_queue import job_queue, dependency_context, JobQueueFullError, INTERRUPTED_MESSAGE
+from app.services.analysis_events import broker, event_stream_response
+from app.services.blob_store import blob_store
+from app.services.derivatives import ensure_derivatives
+from app.utils.executor import inference_executor
 from app.database.repositories.analysis_repository import AnalysisRepository
 from app.database.database import get_db
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
-# Initialize ML service
-ml_service = MLService()
+logger = logging.getLogger(__name__)
 
-@router.post("/", response_model=AnalysisResponse, status_code=status.HTTP_201_CREATED)
+# Page size used when scanning for analyses left unfinished by a restart
+RECOVERY_PAGE_SIZE = 100
+
+async def _fail_analysis_job(analysis_id: str, message: str):
+    """
+    Record a failed job and publish FAILED, even if the record cannot be updated
+    """
+    try:
+        with dependency_context(get_db) as db:
+            await run_in_threadpool(AnalysisRepository(db).update_analysis, analysis_id, {
+                "status": AnalysisStatus.FAILED,
+                "message": message,
+                "updated_at": datetime.utcnow()
+            })
+    except Exception as e:
+        logger.error(f"Error recording failure of analysis {analysis_id}: {str(e)}")
+    broker.publish(analysis_id, AnalysisStatus.FAILED, message=message)
+
+async def _run_analysis_job(analysis_id: str, file_path: str, blob_id: Optional[str] = None):
+    """
+    Background job: run the ML model for an analysis and record the outcome
+    """
+    try:
+        with dependency_context(get_db) as db:
+            analysis_repo = AnalysisRepository(db)
+            await run_in_threadpool(analysis_repo.update_analysis, analysis_id, {
+                "status": AnalysisStatus.PROCESSING,
+                "updated_at": datetime.utcnow()
+            })
+            broker.publish(analysis_id, AnalysisStatus.PROCESSING)
+            
+            # Process the image with ML model
+            result = await inference_executor.run(analyze_image_file, file_path, bounded=False)
+            
+            # Update analysis with results
+            prediction_result = PredictionResult(
+                class_name=result["class_name"],
+                confidence=result["confidence"],
+                probabilities=result["probabilities"]
+            )
+            
+            update_data = {
+                "status": AnalysisStatus.COMPLETED,
+                "result": prediction_result.dict(),
+                "updated_at": datetime.utcnow()
+            }
+            
+            # Thumbnails for list views; a failure here must not fail the analysis
+            if blob_id:
+                try:
+                    update_data["derivatives"] = await run_in_threadpool(ensure_derivatives, blob_id)
+                except Exception as e:
+                    logger.error(f"Error generating derivatives for {blob_id}: {str(e)}")
+            
+            await run_in_threadpool(analysis_repo.update_analysis, analysis_id, update_data)
+    except Exception as e:
+        # Every failure, including the status updates themselves, ends in FAILED
+        await _fail_analysis_job(analysis_id, f"Analysis failed: {str(e)}")
+        return
+    
+    # Push the outcome to anyone following this analysis
+    broker.publish(analysis_id, AnalysisStatus.COMPLETED, result=update_data["result"])
+
+@job_queue.on_recover
+async def _recover_analysis_jobs() -> int:
+    """
+    Fail the analyses a previous process queued or started but never finished
+    """
+    unfinished = {AnalysisStatus.PENDING.value, AnalysisStatus.PROCESSING.value}
+    with dependency_context(get_db) as db:
+        analysis_repo = AnalysisRepository(db)
+        analysis_ids = []
+        page = 1
+        while True:
+            analyses, total = await run_in_threadpool(
+                partial(analysis_repo.list_analyses, user_id=None, page=page, size=RECOVERY_PAGE_SIZE)
+            )
+            analysis_ids.extend(
+                analysis["id"] for analysis in analyses
+                if AnalysisStatus(analysis["status"]).value in unfinished
+            )
+            if not analyses or page * RECOVERY_PAGE_SIZE >= total:
+                break
+            page += 1
+    
+    for analysis_id in analysis_ids:
+        await _fail_analysis_job(analysis_id, INTERRUPTED_MESSAGE)
+    return len(analysis_ids)
+
+@router.post("/", response_model=AnalysisResponse, status_code=status.HTTP_202_ACCEPTED)
 async def create_analysis(
     image: UploadFile = File(...),
     user_id: UUID = Form(...),
@@ -31,7 +126,8 @@ async def create_analysis(
     db = Depends(get_db)
 ):
     """
-    Upload an MRI scan image and create a new analysis
+    Upload an MRI scan image and queue a new analysis.
+    Returns immediately with a PENDING analysis; poll GET /analysis/{id} for the result.
     """
     # Check if the file is an image
     if not image.content_type.startswith('image/'):
@@ -40,20 +136,20 @@ async def create_analysis(
             detail="File uploaded is not an image"
         )
     
+    # Refuse early rather than store a scan we cannot process
+    if job_queue.full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis queue is full, please retry shortly"
+        )
+    
     # Create a unique ID for this analysis
     analysis_id = uuid4()
     
-    # Create directory for uploads if it doesn't exist
-    upload_dir = os.path.join("uploads", str(user_id))
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Save the uploaded file
-    filename = f"{analysis_id}_{image.filename}"
-    file_path = os.path.join(upload_dir, filename)
-    
+    # Store the scan by content; identical uploads share one blob
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        blob_id = await run_in_threadpool(blob_store.put_file, image.file)
+        file_path = blob_store.path(blob_id)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -65,8 +161,9 @@ async def create_analysis(
     analysis_data = {
         "id": str(analysis_id),
         "user_id": str(user_id),
-        "status": AnalysisStatus.PROCESSING,
+        "status": AnalysisStatus.PENDING,
         "original_filename": image.filename,
+        "blob_id": blob_id,
         "image_path": file_path,
         "created_at": datetime.utcnow(),
         "updated_at": datetime.utcnow(),
@@ -76,39 +173,23 @@ async def create_analysis(
     # Create the analysis in database
     analysis = analysis_repo.create_analysis(analysis_data)
     
-    # Process the image with ML model
+    # Hand the ML work to the job queue
     try:
-        result = ml_service.analyze_image(file_path)
-        
-        # Update analysis with results
-        prediction_result = PredictionResult(
-            class_name=result["class_name"],
-            confidence=result["confidence"],
-            probabilities=result["probabilities"]
-        )
-        
-        update_data = {
-            "status": AnalysisStatus.COMPLETED,
-            "result": prediction_result.dict(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        updated_analysis = analysis_repo.update_analysis(str(analysis_id), update_data)
-        return updated_analysis
-        
-    except Exception as e:
-        # Update analysis status to failed
-        update_data = {
+        job_queue.submit(str(analysis_id), partial(_run_analysis_job, str(analysis_id), file_path, blob_id))
+        broker.publish(str(analysis_id), AnalysisStatus.PENDING)
+    except JobQueueFullError as e:
+        analysis_repo.update_analysis(str(analysis_id), {
             "status": AnalysisStatus.FAILED,
-            "message": f"Analysis failed: {str(e)}",
+            "message": str(e),
             "updated_at": datetime.utcnow()
-        }
-        
-        analysis_repo.update_analysis(str(analysis_id), update_data)
+        })
+        broker.publish(str(analysis_id), AnalysisStatus.FAILED, message=str(e))
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error analyzing image: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis queue is full, please retry shortly"
         )
+    
+    return analysis
 
 @router.get("/{analysis_id}", response_model=AnalysisResponse)
 async def get_analysis(
@@ -129,6 +210,37 @@ async def get_analysis(
     
     return analysis
 
+@router.get("/{analysis_id}/events")
+async def analysis_events(
+    analysis_id: UUID,
+    db = Depends(get_db)
+):
+    """
+    Server-sent events stream of status transitions for an analysis.
+    Emits pending/processing/completed/failed as the job worker reaches them,
+    including the results, and closes after the final status.
+    """
+    initial = None
+    if broker.latest(str(analysis_id)) is None:
+        # Not seen by this process yet: seed the stream from the stored state once
+        analysis_repo = AnalysisRepository(db)
+        analysis = analysis_repo.get_analysis(str(analysis_id))
+        
+        if not analysis:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Analysis not found"
+            )
+        
+        initial = {
+            "analysis_id": str(analysis_id),
+            "status": AnalysisStatus(analysis["status"]).value,
+            "result": analysis.get("result"),
+            "message": analysis.get("message")
+        }
+    
+    return event_stream_response(str(analysis_id), initial)
+
 @router.get("/", response_model=AnalysisListResponse)
 async def list_analyses(
     user_id: Optional[UUID] = None,
@@ -204,13 +316,16 @@ async def delete_analysis(
             detail="Analysis not found"
         )
     
-    # Delete the associated image file if it exists
-    if analysis.get("image_path") and os.path.exists(analysis["image_path"]):
-        try:
+    # Release the scan; the blob is only deleted once no analysis uses it
+    try:
+        if analysis.get("blob_id"):
+            await run_in_threadpool(blob_store.release, analysis["blob_id"])
+        elif analysis.get("image_path") and os.path.exists(analysis["image_path"]):
+            # Uploaded before content-addressed storage
             os.remove(analysis["image_path"])
-        except Exception as e:
-            # Log error but continue with deletion
-            print(f"Error deleting file: {str(e)}")
+    except Exception as e:
+        # Log error but continue with deletion
+        logger.error(f"Error deleting file: {str(e)}")
     
     # Delete the analysis from database
     analysis_repo.delete_analysis(str(analysis_id))
@@ -0,0 +1,222 @@
+import logging
+from datetime import datetime
+from functools import partial
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from typing import Optional
+
+from app import database
+from app.schemas.analysis import AnalysisStatus
+from app.schemas.user import User
+from app.services.blob_store import blob_store
+from app.services.derivatives import ensure_derivatives
+from app.services.job_queue import job_queue, JobQueueFullError, INTERRUPTED_MESSAGE
+from app.services.analysis_events import broker, event_stream_response
+from app.utils.auth import get_current_user
+from app.utils.batching import predict_image_batched
+
+router = APIRouter(tags=["analyses"])
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED_STATUSES = [AnalysisStatus.PENDING.value, AnalysisStatus.PROCESSING.value]
+
+def _collection():
+    if database.analyses_collection is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Analysis storage is unavailable")
+    return database.analyses_collection
+
+def _not_found():
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Analysis not found")
+
+async def _get_owned(analysis_id, current_user):
+    """Return the caller's analysis record, or raise 404 (also for other users' analyses)."""
+    if not ObjectId.is_valid(analysis_id):
+        raise _not_found()
+    record = await _collection().find_one({"_id": ObjectId(analysis_id)})
+    if record is None or record.get("user_id") != current_user.id:
+        raise _not_found()
+    return record
+
+def _to_response(record):
+    return {
+        "id": str(record["_id"]),
+        "status": record["status"],
+        "original_filename": record.get("original_filename"),
+        "note": record.get("note"),
+        "result": record.get("result"),
+        "message": record.get("message"),
+        "derivatives": record.get("derivatives"),
+        "created_at": record["created_at"].isoformat(),
+        "updated_at": record["updated_at"].isoformat()
+    }
+
+async def _set_status(analysis_id, status_value, **fields):
+    await database.analyses_collection.update_one(
+        {"_id": ObjectId(analysis_id)},
+        {"$set": {"status": status_value, "updated_at": datetime.utcnow(), **fields}}
+    )
+
+async def _fail_analysis_job(analysis_id: str, message: str):
+    """
+    Record a failed job and publish FAILED, even if the record cannot be updated
+    """
+    try:
+        await _set_status(analysis_id, AnalysisStatus.FAILED.value, message=message)
+    except Exception as e:
+        logger.error(f"Error recording failure of analysis {analysis_id}: {str(e)}")
+    broker.publish(analysis_id, AnalysisStatus.FAILED, message=message)
+
+async def _run_analysis_job(analysis_id: str, blob_id: str):
+    """
+    Background job: run a stored scan through the inference pipeline and record the outcome
+    """
+    try:
+        await _set_status(analysis_id, AnalysisStatus.PROCESSING.value)
+        broker.publish(analysis_id, AnalysisStatus.PROCESSING)
+
+        # Queued jobs were admitted when submitted, so they wait for the executor
+        prediction = await predict_image_batched(blob_store.path(blob_id), bounded=False)
+        result = {
+            "class_name": prediction["result"],
+            "confidence": prediction["confidence"],
+            "probabilities": prediction["class_probabilities"]
+        }
+
+        update = {"result": result}
+        # Thumbnails for list views; a failure here must not fail the analysis
+        try:
+            update["derivatives"] = await run_in_threadpool(ensure_derivatives, blob_id)
+        except Exception as e:
+            logger.error(f"Error generating derivatives for {blob_id}: {str(e)}")
+
+        await _set_status(analysis_id, AnalysisStatus.COMPLETED.value, **update)
+    except Exception as e:
+        # Every failure, including the status updates themselves, ends in FAILED
+        await _fail_analysis_job(analysis_id, f"Analysis failed: {str(e)}")
+        return
+
+    # Push the outcome to anyone following this analysis
+    broker.publish(analysis_id, AnalysisStatus.COMPLETED, result=result)
+
+@job_queue.on_recover
+async def _recover_analysis_jobs() -> int:
+    """
+    Fail the analyses a previous process queued or started but never finished
+    """
+    if database.analyses_collection is None:
+        return 0
+
+    query = {"status": {"$in": UNFINISHED_STATUSES}}
+    analysis_ids = [record["_id"] async for record in database.analyses_collection.find(query, {"_id": 1})]
+    if not analysis_ids:
+        return 0
+
+    await database.analyses_collection.update_many(
+        {"_id": {"$in": analysis_ids}, **query},
+        {"$set": {
+            "status": AnalysisStatus.FAILED.value,
+            "message": INTERRUPTED_MESSAGE,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+    for analysis_id in analysis_ids:
+        broker.publish(str(analysis_id), AnalysisStatus.FAILED, message=INTERRUPTED_MESSAGE)
+    return len(analysis_ids)
+
+@router.post("/", status_code=status.HTTP_202_ACCEPTED)
+async def create_analysis(
+    file: UploadFile = File(...),
+    note: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload an MRI scan and queue an analysis of it.
+    Returns immediately with a pending analysis; poll GET /{analysis_id} for the result.
+    """
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File is not an image")
+
+    collection = _collection()
+
+    # Refuse early rather than store a scan we cannot process
+    if job_queue.full():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis queue is full, please retry shortly"
+        )
+
+    try:
+        # Identical uploads share one blob; this record holds one reference to it
+        blob_id = await run_in_threadpool(blob_store.put_file, file.file)
+    finally:
+        await file.close()
+
+    now = datetime.utcnow()
+    record = {
+        "user_id": current_user.id,
+        "status": AnalysisStatus.PENDING.value,
+        "original_filename": file.filename,
+        "blob_id": blob_id,
+        "note": note,
+        "created_at": now,
+        "updated_at": now
+    }
+    try:
+        inserted = await collection.insert_one(record)
+    except Exception:
+        await run_in_threadpool(blob_store.release, blob_id)
+        raise
+    record["_id"] = inserted.inserted_id
+    analysis_id = str(inserted.inserted_id)
+
+    # Hand the ML work to the job queue
+    try:
+        job_queue.submit(analysis_id, partial(_run_analysis_job, analysis_id, blob_id))
+    except JobQueueFullError:
+        await collection.delete_one({"_id": inserted.inserted_id})
+        await run_in_threadpool(blob_store.release, blob_id)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis queue is full, please retry shortly"
+        )
+    broker.publish(analysis_id, AnalysisStatus.PENDING)
+
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=_to_response(record))
+
+@router.get("/{analysis_id}")
+async def get_analysis(analysis_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Get one of the caller's analyses
+    """
+    return _to_response(await _get_owned(analysis_id, current_user))
+
+@router.get("/{analysis_id}/events")
+async def analysis_events(analysis_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Server-sent events stream of status transitions for one of the caller's analyses.
+    Emits pending/processing/completed/failed as the job worker reaches them,
+    including the result, and closes after the final status.
+    """
+    record = await _get_owned(analysis_id, current_user)
+    # The stored state is only sent if this process has seen no event for the analysis
+    initial = {
+        "analysis_id": analysis_id,
+        "status": record["status"],
+        "result": record.get("result"),
+        "message": record.get("message")
+    }
+    return event_stream_response(analysis_id, initial)
+
+@router.delete("/{analysis_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_analysis(analysis_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Delete one of the caller's analyses and release its scan.
+    The blob is only deleted once no other record uses it.
+    """
+    record = await _get_owned(analysis_id, current_user)
+    await _collection().delete_one({"_id": record["_id"]})
+    await run_in_threadpool(blob_store.release, record["blob_id"])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,29 +1,84 @@
 import os
-import shutil
-import uuid
-from fastapi import APIRouter, HTTPException, UploadFile, File, status
-from fastapi.responses import JSONResponse
-from typing import Dict, Optional
+import io
+import json
+import time
+import asyncio
+import zipfile
+from collections import deque
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Dict, List, Optional
 import logging
 
-from app.utils.prediction import predict_image
+from app.utils.batching import engine, inflight, predict_image_batched, stage_latency
+from app.utils.cache import prediction_cache
+from app.utils.metrics import timed
+from app.utils.profiling import collect_timings, profiler
+from app.utils.auth import get_current_admin, get_current_user, new_release_token, oauth2_scheme
+from app import database
+from app.services.model_registry import model_registry
+from app.services.job_queue import job_queue
+from app.services.analysis_events import broker
+from app.services.blob_store import blob_store
+from app.services.derivatives import generate_derivatives
+from app.services.maintenance import upload_sweeper
+from app.database import pool_monitor
+from app.utils.executor import inference_executor, ExecutorSaturatedError
+from app.utils.admission import admission_control, admission_controller, rate_limiter, RETRY_AFTER_SECONDS
 
 router = APIRouter(tags=["inference"])
 
-# Directory for storing uploaded files
-UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads/temp")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 logger = logging.getLogger(__name__)
 
-@router.post("/analyze")
+# Limits for batch submissions
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 100))
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", 256 * 1024 * 1024))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 16))
+# Results allowed to be in flight or waiting for a slow client when streaming
+STREAM_WINDOW = int(os.environ.get("STREAM_WINDOW", BATCH_CONCURRENCY))
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+_upload_read_latency = stage_latency.labels(stage="upload_read")
+_serialize_latency = stage_latency.labels(stage="serialize")
+
+async def stage_timings_requested(
+    request: Request,
+    timings: bool = Query(False, description="Include per-stage durations in the response (administrators only)")
+):
+    """
+    Dependency returning True when the caller asked for per-stage timings
+
+    Timings are requested with `?timings=true` or an `X-Debug-Timings: 1`
+    header and are only granted to administrators.
+    """
+    requested = timings or request.headers.get("x-debug-timings", "").lower() in ("1", "true", "yes")
+    if not requested:
+        return False
+    # Only authenticate when asked, so ordinary inference calls stay token-free
+    await get_current_admin(await get_current_user(await oauth2_scheme(request)))
+    return True
+
+@router.post("/analyze", dependencies=[Depends(admission_control)])
 async def analyze_image(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    persist: bool = Query(False, description="Keep a copy of the original upload in the blob store until it is released"),
+    include_timings: bool = Depends(stage_timings_requested)
 ):
     """
     ML inference endpoint - Analyze MRI scan image and return tumor detection results.
     This is a stateless endpoint that doesn't store results in a database.
+    The upload is decoded in memory and only stored (content-addressed) when `persist` is set
+    and it decodes; the returned `scan_id` and `release_token` release it again.
+    Administrators can request a `timings` block with per-stage durations.
     """
+    async with profiler.profile_request():
+        with collect_timings() as timings:
+            return await _analyze_upload(file, persist, timings if include_timings else None)
+
+async def _analyze_upload(file, persist, timings):
+    """Run one upload through the pipeline; `timings` is filled and returned when given."""
     # Validate file
     if not file.filename:
         raise HTTPException(status_code=400, detail="File has no filename")
@@ -31,28 +86,61 @@ async def analyze_image(
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File is not an image")
     
-    # Generate unique ID and filename for temporary storage
-    file_id = str(uuid.uuid4())
-    file_extension = os.path.splitext(file.filename)[1]
-    temp_filename = f"{file_id}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, temp_filename)
+    if persist and database.scans_collection is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Scan storage is unavailable")
     
+    started = time.perf_counter()
     try:
-        # Save file to disk temporarily
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Read the upload into memory
+        with timed(_upload_read_latency, "upload_read"):
+            contents = await file.read()
+        
+        decoded = None
+        preview = None
+        
+        async def on_decoded(img):
+            # Only scans that decode are worth keeping
+            nonlocal decoded
+            decoded = img
+        
+        async def on_resized(img):
+            # The model input doubles as the stored preview
+            nonlocal preview
+            preview = img
         
         # Run prediction
-        prediction_result = predict_image(file_path)
+        prediction_result = await predict_image_batched(
+            contents,
+            on_decoded=on_decoded if persist else None,
+            on_resized=on_resized if persist else None
+        )
         
         # Return prediction results
-        return {
+        response = {
             "status": "success",
             "filename": file.filename,
             "result": prediction_result["result"],
             "confidence": prediction_result["confidence"],
             "class_probabilities": prediction_result["class_probabilities"]
         }
+        if decoded is not None:
+            response.update(await _store_scan(contents, file.filename, decoded, preview))
+        if timings is not None:
+            # Serialization is measured after the response is built, so it is not included
+            response["timings"] = {
+                **{stage: round(ms, 3) for stage, ms in timings.items()},
+                "total": round((time.perf_counter() - started) * 1000, 3)
+            }
+        with timed(_serialize_latency):
+            return JSONResponse(content=response)
+    
+    except ExecutorSaturatedError as e:
+        logger.warning(f"Rejecting analysis request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Inference service is busy, please retry shortly",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
     
     except Exception as e:
         logger.error(f"Error analyzing image: {str(e)}")
@@ -63,14 +151,242 @@ async def analyze_image(
     
     finally:
         # Close the file
-        file.file.close()
-        
-        # Clean up temporary file
-        if os.path.exists(file_path):
+        await file.close()
+
+async def _store_scan(contents, filename, img, preview=None):
+    """
+    Keep a decoded upload in the blob store and derive its thumbnails
+
+    The blob reference belongs to a `scans` record, so it is released (and the
+    blob deleted once unused) through DELETE /api/scans/stored/{scan_id} with
+    the returned `release_token`; only the uploader holds it.
+    """
+    release_token, token_digest = new_release_token()
+    # Identical scans are stored once; the id is the content hash
+    blob_id = await run_in_threadpool(blob_store.put, contents)
+    try:
+        record = await database.scans_collection.insert_one({
+            "blob_id": blob_id,
+            "filename": filename,
+            "release_token_digest": token_digest,
+            "created_at": datetime.utcnow()
+        })
+    except Exception:
+        await run_in_threadpool(blob_store.release, blob_id)
+        raise
+    
+    stored = {"scan_id": str(record.inserted_id), "release_token": release_token, "stored_filename": blob_id}
+    try:
+        # Thumbnails come from the decode used for inference; the preview is the model input
+        # unless the prediction was cached, in which case it is resized here
+        stored["derivatives"] = await run_in_threadpool(generate_derivatives, blob_id, img, preview)
+    except Exception as e:
+        logger.error(f"Error generating derivatives for {blob_id}: {str(e)}")
+    return stored
+
+class BatchTooLargeError(Exception):
+    """Raised when a batch request holds more than BATCH_MAX_BYTES of images."""
+
+def _extract_zip(contents, max_bytes, max_files):
+    """
+    Return (filename, bytes) pairs for every image inside a zip archive
+
+    Args:
+        contents: The archive
+        max_bytes: Image bytes the rest of the batch may still hold
+        max_files: Images the rest of the batch may still hold
+    """
+    entries = []
+    total_bytes = 0
+    with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or os.path.splitext(info.filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            # Check declared sizes before inflating anything
+            total_bytes += info.file_size
+            if total_bytes > max_bytes:
+                raise BatchTooLargeError()
+            if len(entries) >= max_files:
+                raise ValueError("Archive exceeds the batch size limit")
+            entries.append((info.filename, archive.read(info)))
+    return entries
+
+def _batch_too_large():
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Batch exceeds {BATCH_MAX_BYTES} bytes of images"
+    )
+
+async def _read_batch(files):
+    """
+    Read batch uploads into (filename, bytes) pairs, expanding zip archives.
+    Images and archive members share one BATCH_MAX_BYTES budget for the whole request.
+    """
+    entries = []
+    total_bytes = 0
+    for upload in files:
+        try:
+            with timed(_upload_read_latency):
+                contents = await upload.read()
+        finally:
+            await upload.close()
+
+        is_zip = (
+            upload.content_type in ("application/zip", "application/x-zip-compressed")
+            or (upload.filename or "").lower().endswith(".zip")
+        )
+        if is_zip:
             try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.error(f"Error removing temporary file: {str(e)}")
+                members = await run_in_threadpool(
+                    _extract_zip, contents, BATCH_MAX_BYTES - total_bytes, BATCH_MAX_FILES - len(entries)
+                )
+            except BatchTooLargeError:
+                raise _batch_too_large()
+            except (zipfile.BadZipFile, ValueError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid archive {upload.filename}: {str(e)}")
+            total_bytes += sum(len(data) for _, data in members)
+            entries.extend(members)
+        elif upload.content_type and upload.content_type.startswith("image/"):
+            total_bytes += len(contents)
+            entries.append((upload.filename, contents))
+        else:
+            raise HTTPException(status_code=400, detail=f"File {upload.filename} is not an image or zip archive")
+
+        if total_bytes > BATCH_MAX_BYTES:
+            raise _batch_too_large()
+        if len(entries) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} images per batch")
+
+    # Key results by filename, disambiguating repeats
+    keyed = []
+    seen = {}
+    for filename, contents in entries:
+        seen[filename] = seen.get(filename, 0) + 1
+        key = filename if seen[filename] == 1 else f"{filename}#{seen[filename]}"
+        keyed.append((key, contents))
+    return keyed
+
+async def _analyze_entry(filename, contents, semaphore):
+    """Analyze one image of a batch under the batch concurrency limit."""
+    async with semaphore:
+        return await _analyze_one(filename, contents)
+
+async def _analyze_one(filename, contents):
+    """Analyze one image of a batch, reporting failures per file instead of failing the batch."""
+    try:
+        # The request was admitted and its concurrency is bounded by the caller, so
+        # files wait for the executor rather than failing when it is saturated
+        prediction_result = await predict_image_batched(contents, bounded=False)
+        return filename, {
+            "status": "success",
+            "result": prediction_result["result"],
+            "confidence": prediction_result["confidence"],
+            "class_probabilities": prediction_result["class_probabilities"]
+        }
+    except Exception as e:
+        logger.error(f"Error analyzing {filename}: {str(e)}")
+        return filename, {"status": "error", "detail": f"Error analyzing image: {str(e)}"}
+
+async def _stream_results(remaining):
+    """
+    Yield one NDJSON line per scan as soon as its prediction finishes.
+
+    At most STREAM_WINDOW scans are scheduled at a time and new ones are only
+    started after a finished line has been handed to the client, so a slow
+    reader throttles the work instead of making the server buffer results.
+    """
+    pending = set()
+    failed = 0
+    count = 0
+    try:
+        while remaining or pending:
+            while remaining and len(pending) < STREAM_WINDOW:
+                # Pop so each upload's bytes can be freed once it is analyzed
+                filename, contents = remaining.popleft()
+                pending.add(asyncio.ensure_future(_analyze_one(filename, contents)))
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                filename, result = task.result()
+                count += 1
+                failed += result["status"] != "success"
+                yield json.dumps({"filename": filename, **result}) + "\n"
+
+        yield json.dumps({"done": True, "count": count, "failed": failed}) + "\n"
+    finally:
+        # The client went away; stop work nobody will read
+        for task in pending:
+            task.cancel()
+
+@router.post("/analyze/batch", dependencies=[Depends(admission_control)])
+async def analyze_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(False, description="Stream one NDJSON line per scan as it completes")
+):
+    """
+    ML inference endpoint - Analyze many MRI scans (or zip archives of scans) in one request.
+    Images are decoded in parallel and share batched forward passes; results are keyed by filename.
+    With `stream` (or `Accept: application/x-ndjson`) results are streamed as NDJSON instead.
+    """
+    entries = await _read_batch(files)
+    if not entries:
+        raise HTTPException(status_code=400, detail="No images found in request")
+
+    if stream or "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(_stream_results(deque(entries)), media_type="application/x-ndjson")
+
+    # Keep enough images in flight to fill a batch without flooding the executor
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    results = {}
+    for next_result in asyncio.as_completed([
+        _analyze_entry(filename, contents, semaphore) for filename, contents in entries
+    ]):
+        filename, result = await next_result
+        results[filename] = result
+
+    failed = sum(1 for result in results.values() if result["status"] != "success")
+    return {
+        "status": "success" if not failed else "partial",
+        "count": len(results),
+        "failed": failed,
+        "results": results
+    }
+
+@router.get("/stats", dependencies=[Depends(get_current_admin)])
+async def inference_stats():
+    """
+    Executor, batching and cache statistics for tuning the inference pipeline (administrators only)
+    """
+    return {
+        "admission": admission_controller.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "executor": inference_executor.stats(),
+        "batching": engine.stats(),
+        "cache": prediction_cache.stats(),
+        "coalescing": inflight.stats(),
+        "models": model_registry.stats(),
+        "jobs": job_queue.stats(),
+        "events": broker.stats(),
+        "blobs": blob_store.stats(),
+        "sweeper": upload_sweeper.stats(),
+        "database": pool_monitor.stats(),
+        "profiler": profiler.stats()
+    }
+
+@router.post("/profile", dependencies=[Depends(get_current_admin)])
+async def arm_profiler(requests: int = Query(10, ge=1, description="Number of upcoming /analyze requests to profile")):
+    """
+    Sample stack traces of the next `requests` analyze requests to a folded-stack file in PROFILE_DIR
+    """
+    return {"armed_requests": profiler.arm(requests), "output_dir": profiler.output_dir}
+
+@router.get("/profile", dependencies=[Depends(get_current_admin)])
+async def profiler_status():
+    """
+    State of the request profiler and the path of the last profile written
+    """
+    return profiler.stats()
 
 @router.get("/health")
 async def health_check():
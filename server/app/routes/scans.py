@@ -0,0 +1,135 @@
+import os
+import hmac
+import logging
+import mimetypes
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from app import database
+
+from app.services.blob_store import blob_store, BlobNotFoundError
+from app.services.derivatives import VARIANTS, MEDIA_TYPES, derivative_path, ensure_derivatives
+from app.utils.auth import get_current_user, release_token_digest
+from app.utils.file_serving import ImmutableFileResponse
+
+router = APIRouter(tags=["scans"])
+# Flat upload directory from before content-addressed storage
+uploads_router = APIRouter(tags=["scans"])
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads/mri-scans")
+
+# Original uploads are served with the type their sniffed extension implies
+ORIGINAL_MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".bmp": "image/bmp",
+    ".tif": "image/tiff",
+    ".gif": "image/gif",
+    ".webp": "image/webp"
+}
+
+def scan_etag(blob_id, variant=None):
+    """Strong ETag for a blob or derivative; the content hash already identifies the bytes."""
+    digest = blob_id.split(".")[0]
+    return f'"{digest}-{variant}"' if variant else f'"{digest}"'
+
+def _accepts(request, media_type):
+    return media_type in request.headers.get("accept", "")
+
+def _not_found():
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Scan not found")
+
+@router.delete("/stored/{scan_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(get_current_user)])
+async def release_stored_scan(scan_id: str, release_token: str = Header(..., alias="X-Release-Token")):
+    """
+    Release a scan kept by /api/inference/analyze?persist=true.
+    Requires the `release_token` returned with the scan in an X-Release-Token header.
+    The blob and its derivatives are deleted once no other record uses them.
+    """
+    if database.scans_collection is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Scan storage is unavailable")
+    if not ObjectId.is_valid(scan_id):
+        raise _not_found()
+
+    record = await database.scans_collection.find_one({"_id": ObjectId(scan_id)})
+    if record is None:
+        raise _not_found()
+    if not hmac.compare_digest(record.get("release_token_digest", ""), release_token_digest(release_token)):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid release token")
+
+    await database.scans_collection.delete_one({"_id": record["_id"]})
+    await run_in_threadpool(blob_store.release, record["blob_id"])
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.api_route("/{blob_id}", methods=["GET", "HEAD"])
+async def get_scan(blob_id: str, request: Request):
+    """
+    Serve an original stored scan.
+    Content-addressed, so responses are cacheable forever; supports
+    If-None-Match, If-Modified-Since and single byte ranges.
+    """
+    try:
+        path = blob_store.path(blob_id)
+        stat_result = await run_in_threadpool(os.stat, path)
+    except (BlobNotFoundError, FileNotFoundError):
+        raise _not_found()
+
+    media_type = ORIGINAL_MEDIA_TYPES.get(os.path.splitext(blob_id)[1], "application/octet-stream")
+    return ImmutableFileResponse(path, request, scan_etag(blob_id), media_type, stat_result)
+
+@router.api_route("/{blob_id}/{variant}", methods=["GET", "HEAD"])
+async def get_scan_derivative(blob_id: str, variant: str, request: Request):
+    """
+    Serve a thumbnail (`thumb128`, `thumb256`) or the 224x224 model-input `preview` of a stored scan.
+    Thumbnails are sent as WebP to clients that accept it; responses are cacheable forever.
+    """
+    try:
+        suffixes = VARIANTS[variant]
+        suffix = ".webp" if ".webp" in suffixes and _accepts(request, "image/webp") else suffixes[0]
+        path = derivative_path(blob_id, variant, suffix)
+    except (KeyError, BlobNotFoundError):
+        raise _not_found()
+
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        if not blob_store.exists(blob_id):
+            raise _not_found()
+        # Scans stored before derivatives existed get them on first request
+        try:
+            await run_in_threadpool(ensure_derivatives, blob_id)
+            stat_result = await run_in_threadpool(os.stat, path)
+        except Exception as e:
+            logger.error(f"Error generating derivatives for {blob_id}: {str(e)}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Could not render scan")
+
+    headers = {"vary": "Accept"} if len(suffixes) > 1 else None
+    return ImmutableFileResponse(
+        path, request, scan_etag(blob_id, variant + suffix), MEDIA_TYPES[suffix], stat_result, headers
+    )
+
+@uploads_router.api_route("/{file_path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def get_legacy_upload(file_path: str, request: Request):
+    """
+    Serve a file from the legacy upload directory with the same caching and range support.
+    Uploads are never modified in place, so size and mtime identify the content.
+    """
+    root = os.path.realpath(UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(root, file_path))
+    if os.path.commonpath([root, path]) != root:
+        raise _not_found()
+
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise _not_found()
+    if not os.path.isfile(path):
+        raise _not_found()
+
+    etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return ImmutableFileResponse(path, request, etag, media_type, stat_result)
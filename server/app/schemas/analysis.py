@@ -52,6 +52,7 @@ class AnalysisResponse(BaseModel):
     updated_at: datetime
     note: Optional[str] = None
     result: Optional[PredictionResult] = None
+    derivatives: Optional[Dict[str, str]] = None
 
     class Config:
         orm_mode = True
@@ -85,6 +86,7 @@ class AnalysisResponse(AnalysisBase):
     result: Optional[TumorType] = None
     confidence: Optional[float] = None
     class_probabilities: Optional[Dict[str, float]] = None
+    derivatives: Optional[Dict[str, str]] = None
     
     class Config:
         schema_extra = {
@@ -0,0 +1,130 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from fastapi.responses import StreamingResponse
+
+from app.schemas.analysis import AnalysisStatus
+
+logger = logging.getLogger(__name__)
+
+# Constants
+EVENTS_KEEPALIVE_SECONDS = float(os.environ.get("ANALYSIS_EVENTS_KEEPALIVE", 15))
+EVENTS_HISTORY_SIZE = int(os.environ.get("ANALYSIS_EVENTS_HISTORY", 1000))
+SUBSCRIBER_QUEUE_SIZE = 16
+
+TERMINAL_STATUSES = {AnalysisStatus.COMPLETED.value, AnalysisStatus.FAILED.value}
+
+class AnalysisEventBroker:
+    """
+    Fans analysis status transitions out to server-sent event subscribers.
+
+    Job workers publish each transition as it happens. The latest event per
+    analysis is kept (bounded) so a client that subscribes after a transition
+    still gets the current state without a database read.
+    """
+
+    def __init__(self, history_size: int = EVENTS_HISTORY_SIZE):
+        self.history_size = history_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._latest: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def publish(self, analysis_id: str, status: AnalysisStatus, **data: Any) -> None:
+        """
+        Record a status transition and push it to every subscriber
+
+        Args:
+            analysis_id: Analysis the event belongs to
+            status: New analysis status
+            **data: Extra fields, e.g. `result` or `message`
+        """
+        event = {
+            "analysis_id": analysis_id,
+            "status": AnalysisStatus(status).value,
+            "timestamp": time.time(),
+            **data
+        }
+
+        self._latest[analysis_id] = event
+        self._latest.move_to_end(analysis_id)
+        while len(self._latest) > self.history_size:
+            self._latest.popitem(last=False)
+
+        for queue in self._subscribers.get(analysis_id, ()):
+            if queue.full():
+                # A stalled client only needs the most recent state
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def latest(self, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """Return the most recent event for an analysis, if one is known."""
+        return self._latest.get(analysis_id)
+
+    async def subscribe(self, analysis_id: str, initial: Optional[Dict[str, Any]] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield events for one analysis until it completes or fails
+
+        `None` is yielded when no event arrived within the keep-alive interval.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(analysis_id, set()).add(queue)
+        try:
+            event = self.latest(analysis_id) or initial
+            if event is not None:
+                yield event
+                if event["status"] in TERMINAL_STATUSES:
+                    return
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                yield event
+                if event["status"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            subscribers = self._subscribers.get(analysis_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[analysis_id]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "tracked_analyses": len(self._latest)
+        }
+
+def _format_sse(event: Optional[Dict[str, Any]]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['status']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+def event_stream_response(analysis_id: str, initial: Optional[Dict[str, Any]] = None) -> StreamingResponse:
+    """
+    Build a text/event-stream response of status transitions for an analysis
+
+    Args:
+        analysis_id: Analysis to follow
+        initial: Current state to send first when the broker has not seen
+            this analysis yet (e.g. it finished before the process restarted)
+    """
+    async def stream():
+        async for event in broker.subscribe(analysis_id, initial):
+            yield _format_sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Shared broker for the analysis routers and job workers
+broker = AnalysisEventBroker()
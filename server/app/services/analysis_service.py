@@ -7,13 +7,13 @@ from sqlalchemy.orm import Session
 
 from app.models.analysis import Analysis
 from app.schemas.analysis import AnalysisCreate, AnalysisResponse, AnalysisStatus, TumorType
-from app.services.ml_service import MLService
+from app.services.ml_service import get_ml_service
 
 
 class AnalysisService:
     def __init__(self, db: Session):
         self.db = db
-        self.ml_service = MLService()
+        self.ml_service = get_ml_service()
 
     def create_analysis(self, user_id: str, note: Optional[str] = None) -> Analysis:
         """
@@ -39,15 +39,28 @@ class AnalysisService:
         """
         Process an MRI scan using the ML service and update the analysis
         """
-        # Get the analysis from the database
-        db_analysis = self.db.query(Analysis).filter(Analysis.id == analysis_id).first()
-        
-        if not db_analysis:
-            raise ValueError(f"Analysis with ID {analysis_id} not found")
-        
         # Use ML service to analyze the image
         result = self.ml_service.analyze_image(image_path)
         
+        return self.complete_analysis(analysis_id, image_path, result)
+    
+    def mark_processing(self, analysis_id: str) -> None:
+        """
+        Mark a queued analysis as being processed
+        """
+        db_analysis = self._get_or_raise(analysis_id)
+        
+        db_analysis.status = "processing"
+        db_analysis.updated_at = datetime.utcnow()
+        
+        self.db.commit()
+    
+    def complete_analysis(self, analysis_id: str, image_path: str, result: dict) -> AnalysisResponse:
+        """
+        Store ML results on an analysis and mark it completed
+        """
+        db_analysis = self._get_or_raise(analysis_id)
+        
         # Update analysis with results
         db_analysis.result = result["class_name"]
         db_analysis.confidence = result["confidence"]
@@ -61,6 +74,46 @@ class AnalysisService:
         # Convert to response model
         return self._to_response(db_analysis, image_path)
     
+    def fail_analysis(self, analysis_id: str, message: str) -> None:
+        """
+        Mark an analysis as failed with an explanatory message
+        """
+        db_analysis = self._get_or_raise(analysis_id)
+        
+        db_analysis.status = "failed"
+        db_analysis.message = message
+        db_analysis.updated_at = datetime.utcnow()
+        
+        self.db.commit()
+    
+    def fail_unfinished_analyses(self, message: str) -> List[str]:
+        """
+        Mark every pending or processing analysis as failed and return their IDs
+        """
+        db_analyses = self.db.query(Analysis).filter(
+            Analysis.status.in_(["pending", "processing"])
+        ).all()
+        
+        for db_analysis in db_analyses:
+            db_analysis.status = "failed"
+            db_analysis.message = message
+            db_analysis.updated_at = datetime.utcnow()
+        
+        self.db.commit()
+        
+        return [db_analysis.id for db_analysis in db_analyses]
+    
+    def _get_or_raise(self, analysis_id: str) -> Analysis:
+        """
+        Get an analysis from the database or raise ValueError
+        """
+        db_analysis = self.db.query(Analysis).filter(Analysis.id == analysis_id).first()
+        
+        if not db_analysis:
+            raise ValueError(f"Analysis with ID {analysis_id} not found")
+        
+        return db_analysis
+    
     def get_analysis_by_id(self, analysis_id: str) -> Optional[AnalysisResponse]:
         """
         Get an analysis by ID
@@ -0,0 +1,265 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Constants
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "uploads/blobs")
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# sha256 hex digest plus the extension sniffed from the content
+BLOB_ID_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,5})?$")
+
+# Leading bytes of the image formats the service accepts
+_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tif"),
+    (b"MM\x00*", ".tif"),
+    (b"GIF8", ".gif")
+)
+
+class BlobNotFoundError(Exception):
+    """Raised when a blob id does not exist in the store."""
+
+def sniff_extension(head: bytes) -> str:
+    """Return the file extension matching the content's magic bytes, or an empty string."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return ""
+
+class BlobStore:
+    """
+    Content-addressed upload storage with reference counting.
+
+    Each blob is stored once under `<root>/<aa>/<bb>/<sha256><ext>`, so
+    identical scans share a file and no directory grows beyond a few hundred
+    entries. Writes go to a temporary file that is renamed into place, and a
+    `.refs` sidecar next to each blob counts the analyses using it; the blob
+    is only deleted when the last reference is released. Sidecar updates are
+    serialized with `flock`, so several worker processes can share a store.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = root
+        self._tmp_dir = os.path.join(root, "tmp")
+        self._counter_lock = threading.Lock()
+        # Only needed where flock is unavailable
+        self._fallback_lock = threading.Lock() if fcntl is None else None
+        self._counters = {"stored": 0, "deduplicated": 0, "released": 0, "deleted": 0}
+
+    def path(self, blob_id: str) -> str:
+        """Return the filesystem path of a blob (which may not exist)."""
+        if not BLOB_ID_PATTERN.match(blob_id):
+            raise BlobNotFoundError(f"Invalid blob id {blob_id!r}")
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    def exists(self, blob_id: str) -> bool:
+        try:
+            return os.path.exists(self.path(blob_id))
+        except BlobNotFoundError:
+            return False
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and add a reference to the blob; returns its id."""
+        digest = hashlib.sha256(data)
+        with self._temp_file() as (tmp, tmp_path):
+            tmp.write(data)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            tmp.close()
+            return self._commit(tmp_path, digest.hexdigest() + sniff_extension(data[:16]))
+
+    def put_file(self, source: BinaryIO) -> str:
+        """Stream a file object into the store, hashing as it is copied; returns the blob id."""
+        digest = hashlib.sha256()
+        head = b""
+        with self._temp_file() as (tmp, tmp_path):
+            while True:
+                chunk = source.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            tmp.close()
+            return self._commit(tmp_path, digest.hexdigest() + sniff_extension(head))
+
+    def add_ref(self, blob_id: str) -> int:
+        """Add a reference to an existing blob; returns the new reference count."""
+        with self._locked_refs(blob_id) as refs:
+            if not os.path.exists(self.path(blob_id)):
+                raise BlobNotFoundError(f"Blob {blob_id} not found")
+            count = refs.read() + 1
+            refs.write(count)
+            return count
+
+    def release(self, blob_id: str) -> bool:
+        """
+        Drop one reference to a blob
+
+        Returns:
+            True if that was the last reference and the blob was deleted;
+            unknown blobs are left alone and return False
+        """
+        if not self.exists(blob_id):
+            return False
+        with self._locked_refs(blob_id) as refs:
+            if not os.path.exists(self.path(blob_id)):
+                # Deleted while we waited for the lock; drop the sidecar the lock recreated
+                os.remove(self.path(blob_id) + ".refs")
+                return False
+            count = max(0, refs.read() - 1)
+            self._count("released")
+            if count > 0:
+                refs.write(count)
+                return False
+
+            self._delete_files(blob_id)
+            return True
+
+    def remove_unreferenced(self, blob_id: str, unchanged_since: Optional[float] = None) -> int:
+        """
+        Delete a blob that has no references, e.g. one left behind by a crash before its count was written
+
+        Args:
+            blob_id: Blob to delete
+            unchanged_since: Keep the blob if a reference was added or dropped
+                after this timestamp, e.g. by a re-upload of the same scan
+
+        Returns:
+            Bytes freed, 0 if the blob was kept
+        """
+        with self._locked_refs(blob_id) as refs:
+            if refs.read() > 0 or (unchanged_since is not None and refs.modified() > unchanged_since):
+                return 0
+            return self._delete_files(blob_id)
+
+    def refcount(self, blob_id: str) -> int:
+        """Return how many references a blob currently has."""
+        try:
+            with open(self.path(blob_id) + ".refs") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"root": self.root, **self._counters}
+
+    def _delete_files(self, blob_id: str) -> int:
+        """Remove a blob with its sidecars and derivatives (`<blob_id>.*`); the caller holds its lock."""
+        freed = 0
+        shard_dir = os.path.dirname(self.path(blob_id))
+        for name in os.listdir(shard_dir):
+            if name == blob_id or name.startswith(blob_id + "."):
+                path = os.path.join(shard_dir, name)
+                try:
+                    size = os.stat(path).st_size
+                    os.remove(path)
+                    freed += size
+                except FileNotFoundError:
+                    pass
+        self._count("deleted")
+        return freed
+
+    def _count(self, counter: str) -> None:
+        with self._counter_lock:
+            self._counters[counter] += 1
+
+    @contextmanager
+    def _temp_file(self) -> Iterator:
+        """A temporary file on the store's filesystem, removed unless it was renamed into place."""
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp_dir)
+        tmp = os.fdopen(fd, "wb")
+        try:
+            yield tmp, tmp_path
+        finally:
+            tmp.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path: str, blob_id: str) -> str:
+        """Move a fully written temporary file into place (unless the blob exists) and add a reference."""
+        blob_path = self.path(blob_id)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with self._locked_refs(blob_id) as refs:
+            if os.path.exists(blob_path):
+                self._count("deduplicated")
+            else:
+                os.replace(tmp_path, blob_path)
+                self._count("stored")
+            refs.write(refs.read() + 1)
+        return blob_id
+
+    @contextmanager
+    def _locked_refs(self, blob_id: str) -> Iterator["_RefsFile"]:
+        """Open a blob's `.refs` sidecar under an exclusive lock."""
+        refs_path = self.path(blob_id) + ".refs"
+        os.makedirs(os.path.dirname(refs_path), exist_ok=True)
+        while True:
+            f = open(refs_path, "a+")
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # A releaser may have deleted the sidecar while we waited; lock the new one instead
+            try:
+                same_file = os.path.samestat(os.fstat(f.fileno()), os.stat(refs_path))
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                break
+            f.close()
+
+        try:
+            if self._fallback_lock is None:
+                yield _RefsFile(f)
+            else:
+                with self._fallback_lock:
+                    yield _RefsFile(f)
+        finally:
+            f.close()
+
+class _RefsFile:
+    """Reference count stored as a decimal number in an open sidecar file."""
+
+    def __init__(self, f):
+        self._f = f
+
+    def read(self) -> int:
+        self._f.seek(0)
+        try:
+            return int(self._f.read().strip() or 0)
+        except ValueError:
+            return 0
+
+    def modified(self) -> float:
+        """When the count was last written."""
+        return os.fstat(self._f.fileno()).st_mtime
+
+    def write(self, count: int) -> None:
+        self._f.seek(0)
+        self._f.truncate()
+        self._f.write(str(count))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+# Shared store for uploads
+blob_store = BlobStore()
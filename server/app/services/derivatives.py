@@ -0,0 +1,102 @@
+import os
+import logging
+import tempfile
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+from app.services.blob_store import blob_store, BlobNotFoundError
+from app.utils.prediction import decode_image, resize_image
+
+logger = logging.getLogger(__name__)
+
+# Constants
+THUMBNAIL_SIZES = [int(size) for size in os.environ.get("THUMBNAIL_SIZES", "128,256").split(",") if size]
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", 85))
+SCANS_URL_PREFIX = "/api/scans"
+
+# Variant name -> encodings stored next to the original blob, default first.
+# Thumbnails also get a smaller WebP encoding for clients that accept it.
+VARIANTS = {f"thumb{size}": (".jpg", ".webp") for size in THUMBNAIL_SIZES}
+VARIANTS["preview"] = (".png",)
+MEDIA_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+def derivative_path(blob_id: str, variant: str, suffix: Optional[str] = None) -> str:
+    """Return where a derivative of a blob is stored: next to the original."""
+    if variant not in VARIANTS:
+        raise BlobNotFoundError(f"Unknown variant {variant!r}")
+    suffix = suffix or VARIANTS[variant][0]
+    if suffix not in VARIANTS[variant]:
+        raise BlobNotFoundError(f"Variant {variant!r} has no {suffix} encoding")
+    return f"{blob_store.path(blob_id)}.{variant}{suffix}"
+
+def derivative_urls(blob_id: str) -> Dict[str, str]:
+    """URLs of every derivative of a blob, as served by the scans route."""
+    return {variant: f"{SCANS_URL_PREFIX}/{blob_id}/{variant}" for variant in VARIANTS}
+
+def _thumbnail(img: np.ndarray, size: int) -> np.ndarray:
+    """Downscale so the longest side is `size`, keeping the aspect ratio."""
+    height, width = img.shape[:2]
+    scale = size / max(height, width)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+
+def _write_atomic(path: str, suffix: str, img: np.ndarray) -> None:
+    params = {
+        ".jpg": [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY],
+        ".webp": [cv2.IMWRITE_WEBP_QUALITY, THUMBNAIL_QUALITY]
+    }.get(suffix, [])
+    ok, encoded = cv2.imencode(suffix, img, params)
+    if not ok:
+        raise ValueError(f"Could not encode {path}")
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def generate_derivatives(blob_id: str, img: np.ndarray, preview: Optional[np.ndarray] = None) -> Dict[str, str]:
+    """
+    Write the thumbnails and model-input preview of a stored scan
+
+    Args:
+        blob_id: Blob the derivatives belong to
+        img: The decoded BGR image, as already decoded for inference
+        preview: The 224x224 model input, if it was already resized
+
+    Returns:
+        Mapping of variant name to URL
+    """
+    for variant, suffixes in VARIANTS.items():
+        paths = {suffix: derivative_path(blob_id, variant, suffix) for suffix in suffixes}
+        # Blobs are immutable, so existing derivatives are always current
+        missing = [suffix for suffix, path in paths.items() if not os.path.exists(path)]
+        if not missing:
+            continue
+        if variant == "preview":
+            derived = preview if preview is not None else resize_image(img)
+        else:
+            derived = _thumbnail(img, int(variant[len("thumb"):]))
+        for suffix in missing:
+            _write_atomic(paths[suffix], suffix, derived)
+    return derivative_urls(blob_id)
+
+def _all_derivatives_exist(blob_id: str) -> bool:
+    return all(
+        os.path.exists(derivative_path(blob_id, variant, suffix))
+        for variant, suffixes in VARIANTS.items()
+        for suffix in suffixes
+    )
+
+def ensure_derivatives(blob_id: str) -> Dict[str, str]:
+    """Generate any missing derivatives of a blob, decoding the original only if needed."""
+    if _all_derivatives_exist(blob_id):
+        return derivative_urls(blob_id)
+    return generate_derivatives(blob_id, decode_image(blob_store.path(blob_id)))
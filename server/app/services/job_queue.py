@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.utils.metrics import Histogram, LATENCY_MS_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+# Constants
+JOB_WORKERS = int(os.environ.get("ANALYSIS_JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("ANALYSIS_JOB_QUEUE_SIZE", 100))
+# Fail analyses a previous process left unfinished; disable when several processes share the database
+JOB_RECOVERY = os.environ.get("ANALYSIS_JOB_RECOVERY", "true").lower() in ("1", "true", "yes")
+INTERRUPTED_MESSAGE = "Analysis was interrupted by a service restart, please resubmit"
+
+class JobQueueFullError(Exception):
+    """Raised when the analysis job queue cannot accept more work."""
+
+@contextmanager
+def dependency_context(dependency: Callable[[], Any]):
+    """
+    Resolve a FastAPI-style dependency (plain or generator) outside a request
+
+    Background jobs outlive the request that created them, so they cannot
+    reuse the request's database handle and open their own this way.
+    """
+    resource = dependency()
+    if inspect.isgenerator(resource):
+        try:
+            yield next(resource)
+        finally:
+            resource.close()
+    else:
+        yield resource
+
+class AnalysisJobQueue:
+    """
+    In-process queue that runs analysis jobs on background worker tasks.
+
+    Routers enqueue a job and return immediately with a PENDING analysis;
+    the workers drive it through PROCESSING to COMPLETED or FAILED.
+
+    Queued and running jobs do not survive a restart, so routers register a
+    recovery hook that marks the analyses they left unfinished as FAILED;
+    `recover` runs the hooks once the database is connected.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_size: int = JOB_QUEUE_SIZE):
+        self.workers = max(1, int(workers))
+        self.max_size = max(0, int(max_size))
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._running = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "recovered": 0}
+        self._recovery_hooks = []
+        self.wait_histogram = Histogram(LATENCY_MS_BUCKETS)
+        self.run_histogram = Histogram(LATENCY_MS_BUCKETS)
+
+    def _ensure_started(self) -> None:
+        """Start the worker tasks on the running event loop if needed."""
+        if self._tasks and not all(task.done() for task in self._tasks):
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def full(self) -> bool:
+        """Return True if a new job would be rejected."""
+        return self._queue is not None and self._queue.full()
+
+    def submit(self, job_id: str, job: Callable[[], Awaitable[Any]]) -> None:
+        """
+        Enqueue a job without waiting for it
+
+        Args:
+            job_id: Identifier used in logs (normally the analysis id)
+            job: Coroutine function run by a worker
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((job_id, job, time.perf_counter()))
+        except asyncio.QueueFull:
+            self._counters["rejected"] += 1
+            raise JobQueueFullError(f"Analysis queue is full ({self._queue.qsize()} jobs waiting)")
+        self._counters["submitted"] += 1
+
+    def on_recover(self, hook: Callable[[], Awaitable[int]]) -> Callable[[], Awaitable[int]]:
+        """
+        Register a coroutine function that fails the analyses a previous process left unfinished
+
+        The hook returns how many analyses it recovered. Usable as a decorator.
+        """
+        self._recovery_hooks.append(hook)
+        return hook
+
+    async def recover(self) -> int:
+        """
+        Run the recovery hooks; call on startup, before any job is submitted
+
+        Returns:
+            Number of analyses marked as failed
+        """
+        if not JOB_RECOVERY:
+            return 0
+        recovered = 0
+        for hook in self._recovery_hooks:
+            try:
+                recovered += await hook()
+            except Exception as e:
+                logger.error(f"Analysis job recovery failed: {str(e)}")
+        if recovered:
+            logger.warning(f"Marked {recovered} interrupted analyses as failed")
+        self._counters["recovered"] += recovered
+        return recovered
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, job, enqueued = await self._queue.get()
+            started = time.perf_counter()
+            self.wait_histogram.observe((started - enqueued) * 1000)
+            self._running += 1
+            try:
+                await job()
+                self._counters["completed"] += 1
+            except Exception as e:
+                # Jobs record their own failure status; this only guards the worker
+                logger.error(f"Analysis job {job_id} failed: {str(e)}")
+                self._counters["failed"] += 1
+            finally:
+                self._running -= 1
+                self.run_histogram.observe((time.perf_counter() - started) * 1000)
+                self._queue.task_done()
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks; queued jobs are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, job counters and wait/run time histograms."""
+        return {
+            "workers": self.workers,
+            "max_size": self.max_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            **self._counters,
+            "wait_ms": self.wait_histogram.snapshot(),
+            "run_ms": self.run_histogram.snapshot()
+        }
+
+# Shared queue for the analysis routers
+job_queue = AnalysisJobQueue()
+registry.gauge("analysis_jobs", "Background analysis jobs by state", lambda: [
+    ({"state": "queued"}, job_queue.stats()["queued"]),
+    ({"state": "running"}, job_queue.stats()["running"])
+])
@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app import database
+from app.services.blob_store import blob_store, BlobStore, BLOB_ID_PATTERN
+from app.utils.metrics import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+# Constants
+# Seconds between sweeps (0 disables the sweeper) and files examined per sweep
+SWEEP_INTERVAL = float(os.environ.get("SWEEP_INTERVAL", 60))
+SWEEP_BATCH_FILES = int(os.environ.get("SWEEP_BATCH_FILES", 500))
+# Temporary files younger than this may still be being written
+SWEEP_TMP_GRACE = float(os.environ.get("SWEEP_TMP_GRACE", 3600))
+# Also delete unreferenced blobs that no record mentions, once older than the grace period
+SWEEP_ORPHANS = os.environ.get("SWEEP_ORPHANS", "false").lower() in ("1", "true", "yes")
+SWEEP_ORPHAN_GRACE = float(os.environ.get("SWEEP_ORPHAN_GRACE", 86400))
+
+SWEEP_REASONS = ("temporary", "orphaned")
+
+class _Candidate:
+    """A file the sweeper may remove, and why."""
+
+    __slots__ = ("path", "reason", "blob_id", "cutoff")
+
+    def __init__(self, path: str, reason: str, blob_id: Optional[str] = None, cutoff: Optional[float] = None):
+        self.path = path
+        self.reason = reason
+        self.blob_id = blob_id
+        # Only remove the file if it has not changed since this timestamp
+        self.cutoff = cutoff
+
+class UploadSweeper:
+    """
+    Background task that reclaims disk space in the blob store.
+
+    Each sweep examines at most `batch_files` files, resuming the directory
+    walk where the previous sweep stopped, so a large store costs a bounded
+    amount of I/O per interval instead of one long scan. It removes:
+
+    - temporary files left by interrupted writes (`tmp/` and `*.tmp`
+      derivatives) and stray sidecars of deleted blobs;
+    - with SWEEP_ORPHANS, blobs older than SWEEP_ORPHAN_GRACE that have no
+      references and that no analysis or scan record mentions.
+
+    A blob with references is never removed. UPLOAD_DIR is left alone: the
+    Node backend writes its scans there and owns their lifecycle.
+    """
+
+    def __init__(
+        self,
+        store: BlobStore = blob_store,
+        interval: float = SWEEP_INTERVAL,
+        batch_files: int = SWEEP_BATCH_FILES,
+        orphans: bool = SWEEP_ORPHANS
+    ):
+        self.store = store
+        self.interval = interval
+        self.batch_files = max(1, int(batch_files))
+        self.orphans = orphans
+        self._task: Optional[asyncio.Task] = None
+        self._walker: Optional[Iterator[Tuple[str, str, frozenset]]] = None
+        self._passes = 0
+        self._examined = 0
+        self._last_pass_seconds = None
+        self._pass_started = None
+        self.removed_files = {reason: Counter() for reason in SWEEP_REASONS}
+        self.reclaimed_bytes = {reason: Counter() for reason in SWEEP_REASONS}
+
+    def start(self) -> None:
+        """Start sweeping on the running event loop (no-op when disabled or already running)."""
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the background task; a sweep in progress is abandoned."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep_once()
+            except Exception as e:
+                logger.error(f"Upload sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def sweep_once(self) -> int:
+        """
+        Examine the next `batch_files` files and remove the ones no longer needed
+
+        Returns:
+            Bytes reclaimed by this sweep
+        """
+        candidates = await run_in_threadpool(self._scan_batch, time.time())
+        reclaimed = 0
+        for candidate in candidates:
+            if candidate.reason == "orphaned" and not await self._is_orphaned(candidate):
+                continue
+            freed = await run_in_threadpool(self._remove, candidate)
+            if freed is None:
+                continue
+            self.removed_files[candidate.reason].inc()
+            self.reclaimed_bytes[candidate.reason].inc(freed)
+            reclaimed += freed
+            logger.info(f"Removed {candidate.reason} upload {candidate.path} ({freed} bytes)")
+        return reclaimed
+
+    def _walk(self) -> Iterator[Tuple[str, str, frozenset]]:
+        """Yield (directory, name, siblings) for every file in the blob store."""
+        stack = [self.store.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+            files = frozenset(entry.name for entry in entries if entry.is_file(follow_symlinks=False))
+            stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            for name in sorted(files):
+                yield directory, name, files
+
+    def _scan_batch(self, now: float) -> List[_Candidate]:
+        """Advance the walk by up to `batch_files` files and return the removal candidates."""
+        if self._walker is None:
+            self._walker = self._walk()
+            self._pass_started = time.perf_counter()
+
+        batch = list(islice(self._walker, self.batch_files))
+        self._examined += len(batch)
+        if len(batch) < self.batch_files:
+            # This pass is complete; the next sweep starts over
+            self._walker = None
+            self._passes += 1
+            self._last_pass_seconds = round(time.perf_counter() - self._pass_started, 3)
+
+        tmp_dir = os.path.join(self.store.root, "tmp")
+        candidates = []
+        for directory, name, siblings in batch:
+            path = os.path.join(directory, name)
+            try:
+                age = now - os.lstat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            candidate = self._classify(directory == tmp_dir, path, name, siblings, age, now)
+            if candidate is not None:
+                candidates.append(candidate)
+        return candidates
+
+    def _classify(self, in_tmp, path, name, siblings, age, now) -> Optional[_Candidate]:
+        if in_tmp or name.endswith(".tmp"):
+            return _Candidate(path, "temporary", cutoff=now - SWEEP_TMP_GRACE) if age > SWEEP_TMP_GRACE else None
+
+        if not BLOB_ID_PATTERN.match(name):
+            # Sidecars and derivatives go with their blob; alone they are leftovers of a removal
+            owned = any(name.startswith(sibling + ".") for sibling in siblings if BLOB_ID_PATTERN.match(sibling))
+            if owned or age <= SWEEP_TMP_GRACE:
+                return None
+            return _Candidate(path, "temporary", cutoff=now - SWEEP_TMP_GRACE)
+
+        if self.orphans and age > SWEEP_ORPHAN_GRACE:
+            return _Candidate(path, "orphaned", name, now - SWEEP_ORPHAN_GRACE)
+        return None
+
+    async def _is_orphaned(self, candidate: _Candidate) -> bool:
+        """True if no record mentions the blob; False when that cannot be checked."""
+        collections = (database.analyses_collection, database.scans_collection)
+        if any(collection is None for collection in collections):
+            return False
+        # The Python routers record blob_id and image_path; the Node backend writes imagePath
+        lookups = [
+            (database.analyses_collection, {"blob_id": candidate.blob_id}),
+            (database.analyses_collection, {"image_path": candidate.path}),
+            (database.analyses_collection, {"imagePath": candidate.path}),
+            (database.scans_collection, {"blob_id": candidate.blob_id})
+        ]
+        try:
+            for collection, query in lookups:
+                if await collection.find_one(query) is not None:
+                    return False
+        except Exception as e:
+            logger.warning(f"Could not look up the records for {candidate.path}: {str(e)}")
+            return False
+        return True
+
+    def _remove(self, candidate: _Candidate) -> Optional[int]:
+        """Delete a candidate; returns the bytes freed, or None if it was kept or already gone."""
+        if candidate.blob_id:
+            # Under the blob's lock, so a blob referenced meanwhile is kept
+            freed = self.store.remove_unreferenced(candidate.blob_id, unchanged_since=candidate.cutoff)
+            return freed or None
+
+        try:
+            stat_result = os.lstat(candidate.path)
+            if stat_result.st_mtime > candidate.cutoff:
+                return None
+            os.remove(candidate.path)
+        except FileNotFoundError:
+            return None
+        return stat_result.st_size
+
+    def stats(self) -> Dict[str, Any]:
+        """Return sweep progress and the files and bytes reclaimed, by reason."""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval": self.interval,
+            "batch_files": self.batch_files,
+            "orphans": self.orphans,
+            "passes": self._passes,
+            "examined": self._examined,
+            "last_pass_seconds": self._last_pass_seconds,
+            "removed_files": {reason: int(counter.value) for reason, counter in self.removed_files.items()},
+            "reclaimed_bytes": {reason: int(counter.value) for reason, counter in self.reclaimed_bytes.items()}
+        }
+
+# Shared sweeper for the blob store
+upload_sweeper = UploadSweeper()
+removed_files = registry.counter("sweeper_removed_files", "Files removed from the blob store by the sweeper, by reason")
+reclaimed_bytes = registry.counter("sweeper_reclaimed_bytes", "Disk space reclaimed by the sweeper, by reason")
+for reason in SWEEP_REASONS:
+    removed_files.attach(upload_sweeper.removed_files[reason], reason=reason)
+    reclaimed_bytes.attach(upload_sweeper.reclaimed_bytes[reason], reason=reason)
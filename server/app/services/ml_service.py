@@ -2,12 +2,10 @@ import os
 import json
 import numpy as np
 from PIL import Image
-import torch
-from torchvision import transforms
 from typing import Dict, Any, List, Tuple
-import tensorflow as tf
 import logging
 from app.schemas.analysis import TumorType
+from app.utils.backends import INFERENCE_BACKEND, backend_model_path, load_backend
 
 logger = logging.getLogger(__name__)
 
@@ -28,15 +26,14 @@ class MLService:
         self._load_model()
     
     def _load_model(self) -> None:
-        """Load the TensorFlow model"""
+        """Resolve the configured inference backend through the shared model registry"""
         try:
-            if os.path.exists(self.model_path):
-                logger.info(f"Loading model from {self.model_path}")
-                self.model = tf.keras.models.load_model(self.model_path)
-                logger.info("Model loaded successfully")
+            model_path = backend_model_path(INFERENCE_BACKEND, self.model_path)
+            if os.path.exists(model_path):
+                self.model = load_backend(self.model_path)
             else:
-                logger.error(f"Model file not found at {self.model_path}")
-                raise FileNotFoundError(f"Model file not found at {self.model_path}")
+                logger.error(f"Model file not found at {model_path}")
+                raise FileNotFoundError(f"Model file not found at {model_path}")
         except Exception as e:
             logger.error(f"Error loading model: {str(e)}")
             raise Exception(f"Failed to load model: {str(e)}")
@@ -109,36 +106,6 @@ class MLService:
             logger.error(f"Error during image analysis: {str(e)}")
             raise Exception(f"Failed to analyze image: {str(e)}")
 
-    def _load_model(self):
-        """
-        Load the pre-trained PyTorch model
-        """
-        # Path to the model file (adjust as needed)
-        model_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                                 "models", "brain_tumor_model.pth")
-        
-        # Check if model exists
-        if not os.path.exists(model_path):
-            # For testing purposes, return a dummy model
-            print(f"Warning: Model not found at {model_path}. Using dummy model.")
-            return None
-        
-        # Load the model
-        model = torch.load(model_path, map_location=self.device)
-        model.eval()
-        return model
-    
-    def _get_transforms(self):
-        """
-        Define image transformations for the model
-        """
-        return transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                                std=[0.229, 0.224, 0.225])
-        ])
-    
     def _generate_dummy_prediction(self) -> Dict[str, Any]:
         """
         Generate a dummy prediction for testing when no model is available
@@ -154,4 +121,23 @@ class MLService:
                 class_name: float(prob) 
                 for class_name, prob in zip(self.class_names, probs)
             }
-        } 
\ No newline at end of file
+        } 
+
+# Shared instance used by every router and AnalysisService
+_ml_service = None
+
+def get_ml_service() -> MLService:
+    """Return the process-wide MLService, creating it on first use"""
+    global _ml_service
+    if _ml_service is None:
+        _ml_service = MLService()
+    return _ml_service
+
+def analyze_image_file(image_path: str) -> Dict[str, Any]:
+    """
+    Analyze an image with the shared MLService
+
+    Module-level so it can be submitted to the inference executor, including
+    a process pool where each worker builds its own service.
+    """
+    return get_ml_service().analyze_image(image_path)
@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+def current_rss_bytes() -> int:
+    """Return the resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, ValueError):
+        return 0
+
+def _weights_bytes(model: Any) -> int:
+    """Estimate the memory held by a Keras model's weights."""
+    try:
+        return int(sum(w.shape.num_elements() * w.dtype.size for w in model.weights))
+    except Exception:
+        return 0
+
+def _load_keras_model(model_path: str) -> Any:
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_path)
+
+class ModelRegistry:
+    """
+    Process-wide registry that loads each model file once and shares it.
+
+    Every code path that needs the classifier (the inference utilities,
+    MLService and AnalysisService) resolves it through `get`, so the weights
+    are only held in memory once per process regardless of how many services
+    are constructed.
+    """
+
+    def __init__(self):
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_path: str, loader: Optional[Callable[[str], Any]] = None) -> Any:
+        """
+        Return the model stored at `model_path`, loading it on first use
+
+        Args:
+            model_path: Path to the model file
+            loader: Function that loads the file; defaults to Keras `load_model`
+
+        Returns:
+            The shared model instance
+        """
+        key = os.path.abspath(model_path)
+
+        entry = self._models.get(key)
+        if entry is not None:
+            return entry["model"]
+
+        # Hold the lock while loading so concurrent callers wait for one load
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                return entry["model"]
+
+            if not os.path.exists(key):
+                raise FileNotFoundError(f"Model file not found at {model_path}")
+
+            logger.info(f"Loading model from {model_path}")
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+
+            model = (loader or _load_keras_model)(key)
+
+            load_seconds = time.perf_counter() - started
+            self._models[key] = {
+                "model": model,
+                "loaded_at": time.time(),
+                "load_seconds": load_seconds,
+                "file_bytes": os.path.getsize(key),
+                "weights_bytes": _weights_bytes(model),
+                "rss_delta_bytes": max(0, current_rss_bytes() - rss_before)
+            }
+            logger.info(f"Model loaded in {load_seconds:.2f}s")
+            return model
+
+    def loaded(self, model_path: str) -> bool:
+        """Return True if the model at `model_path` is already in memory."""
+        return os.path.abspath(model_path) in self._models
+
+    def stats(self) -> Dict[str, Any]:
+        """Return memory accounting for every loaded model and the process."""
+        models = {
+            path: {k: v for k, v in entry.items() if k != "model"}
+            for path, entry in list(self._models.items())
+        }
+        return {
+            "models": models,
+            "process_rss_bytes": current_rss_bytes()
+        }
+
+# Shared registry for the whole process
+model_registry = ModelRegistry()
+
+registry.gauge("process_resident_memory_bytes", "Resident set size of the ML service process", current_rss_bytes)
+registry.gauge("model_load_seconds", "Time taken to load each model file", lambda: [
+    ({"model": os.path.basename(path)}, entry["load_seconds"])
+    for path, entry in model_registry.stats()["models"].items()
+])
+registry.gauge("model_weights_bytes", "Estimated memory held by each model's weights", lambda: [
+    ({"model": os.path.basename(path)}, entry["weights_bytes"])
+    for path, entry in model_registry.stats()["models"].items()
+])
@@ -0,0 +1,219 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import ipaddress
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, Request, status
+
+from app.utils.metrics import registry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def _parse_networks(value):
+    """Parse a comma-separated list of IP addresses and CIDR ranges."""
+    networks = []
+    for item in value.split(","):
+        if item.strip():
+            try:
+                networks.append(ipaddress.ip_network(item.strip(), strict=False))
+            except ValueError:
+                logger.warning(f"Ignoring invalid TRUSTED_PROXIES entry {item.strip()!r}")
+    return networks
+
+# Constants
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", 16))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", 64))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 5))
+RETRY_AFTER_SECONDS = int(os.environ.get("ADMISSION_RETRY_AFTER", 2))
+RATE_LIMIT_PER_SECOND = float(os.environ.get("RATE_LIMIT_PER_SECOND", 0))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_MAX_CLIENTS = 10000
+# Proxies (IPs or CIDR ranges) allowed to report the client address in X-Forwarded-For
+TRUSTED_PROXIES = _parse_networks(os.environ.get("TRUSTED_PROXIES", ""))
+
+class ServiceOverloadedError(Exception):
+    """Raised when a request is shed because the service is at capacity."""
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded wait queue.
+
+    Up to `max_concurrent` requests run at once and up to `max_queue` more may
+    wait (for at most `queue_timeout` seconds) for a slot. Anything beyond
+    that is shed immediately instead of piling up inside TensorFlow.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+
+        self._semaphore = None
+        self._active = 0
+        self._waiting = 0
+        self._counters = {"admitted": 0, "shed_queue_full": 0, "shed_timeout": 0}
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot for the duration of the block."""
+        if self._semaphore is None:
+            # Created lazily so it binds to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self._counters["shed_queue_full"] += 1
+            raise ServiceOverloadedError(f"{self._waiting} requests already waiting")
+
+        self._waiting += 1
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            done, _ = await asyncio.wait({acquire}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(acquire)
+            raise
+        finally:
+            self._waiting -= 1
+        if not done:
+            self._abandon(acquire)
+            self._counters["shed_timeout"] += 1
+            raise ServiceOverloadedError(f"No slot became free within {self.queue_timeout}s")
+
+        self._active += 1
+        self._counters["admitted"] += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+
+    def _abandon(self, acquire):
+        """Stop waiting for a slot, giving it back if it was granted at the same moment."""
+        acquire.cancel()
+        acquire.add_done_callback(
+            lambda task: task.cancelled() or task.exception() is not None or self._semaphore.release()
+        )
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self._active,
+            "waiting": self._waiting,
+            **self._counters
+        }
+
+class TokenBucketLimiter:
+    """
+    Per-client token bucket rate limiter.
+
+    Each client may make `burst` requests at once and then `rate` requests per
+    second on average. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._limited = 0
+
+    def acquire(self, client):
+        """
+        Take one token for `client`
+
+        Returns:
+            0 if the request may proceed, otherwise seconds until a token is available
+        """
+        if self.rate <= 0:
+            return 0
+
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens >= 1:
+            retry_after = 0
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate
+            self._limited += 1
+
+        # Re-insert as most recent and forget the least recently seen clients
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+        return retry_after
+
+    def stats(self):
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tracked_clients": len(self._buckets),
+            "rate_limited": self._limited
+        }
+
+def _is_trusted_proxy(host):
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+def client_identifier(request: Request):
+    """
+    Identify the calling client
+
+    X-Forwarded-For is only honoured when the peer is a trusted proxy, since
+    anyone else can set it to whatever they like. The header is read from
+    the right, skipping trusted proxies, so only the hop our proxy added counts.
+    """
+    peer = request.client.host if request.client else "unknown"
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or not _is_trusted_proxy(peer):
+        return peer
+
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+# Shared limits for the inference routes
+admission_controller = AdmissionController()
+rate_limiter = TokenBucketLimiter()
+registry.gauge("admission_requests", "Requests holding or waiting for an admission slot", lambda: [
+    ({"state": "active"}, admission_controller.stats()["active"]),
+    ({"state": "waiting"}, admission_controller.stats()["waiting"])
+])
+
+async def admission_control(request: Request):
+    """
+    FastAPI dependency applying the per-client rate limit and the concurrency limit
+
+    Rate-limited clients get 429 and shed requests get 503, both with Retry-After.
+    """
+    retry_after = rate_limiter.acquire(client_identifier(request))
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+    try:
+        async with admission_controller.slot():
+            yield
+    except ServiceOverloadedError as e:
+        logger.warning(f"Shedding request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Inference service is busy, please retry shortly",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+        )
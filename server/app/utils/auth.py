@@ -1,4 +1,6 @@
 import os
+import hashlib
+import secrets
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -7,8 +9,8 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from bson import ObjectId
 
-from app.database import users_collection
-from app.schemas.user import TokenData, User, UserInDB
+from app import database
+from app.schemas.user import TokenData, User, UserInDB, UserRole
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -29,9 +31,18 @@ def get_password_hash(password):
     """Hash a password for storing."""
     return pwd_context.hash(password)
 
+def new_release_token():
+    """Return a token for releasing a stored scan and the digest to keep with it."""
+    token = secrets.token_urlsafe(32)
+    return token, release_token_digest(token)
+
+def release_token_digest(token: str):
+    """Digest of a release token; only this is stored, so reading the database cannot release scans."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
 async def get_user_by_email(email: str):
     """Get a user by email."""
-    user_dict = await users_collection.find_one({"email": email})
+    user_dict = await database.users_collection.find_one({"email": email})
     if user_dict:
         return UserInDB(**user_dict)
     return None
@@ -40,7 +51,7 @@ async def get_user_by_id(user_id: str):
     """Get a user by ID."""
     if not ObjectId.is_valid(user_id):
         return None
-    user_dict = await users_collection.find_one({"_id": ObjectId(user_id)})
+    user_dict = await database.users_collection.find_one({"_id": ObjectId(user_id)})
     if user_dict:
         return UserInDB(**user_dict)
     return None
@@ -89,4 +100,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         email=user.email,
         role=user.role,
         created_at=user.created_at
-    ) 
\ No newline at end of file
+    )
+
+async def get_current_admin(current_user: User = Depends(get_current_user)):
+    """Require the current user to be an administrator."""
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administrator privileges required"
+        )
+    return current_user
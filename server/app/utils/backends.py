@@ -0,0 +1,282 @@
+import os
+import logging
+import threading
+import numpy as np
+
+from app.services.model_registry import model_registry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras").lower()
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "")
+TFLITE_MODEL_PATH = os.environ.get("TFLITE_MODEL_PATH", "")
+# Quantized TFLite variant built by convert_model.py --quantize ("float32", "dynamic", "int8", "float16")
+MODEL_VARIANT = os.environ.get("MODEL_VARIANT", "float32").lower()
+BACKEND_NUM_THREADS = int(os.environ.get("BACKEND_NUM_THREADS", 0))
+PARITY_TOLERANCE = float(os.environ.get("BACKEND_PARITY_TOLERANCE", 1e-3))
+
+class InferenceBackend:
+    """
+    Common interface for the runtimes that can execute the classifier.
+
+    `predict` takes a float32 batch of shape (N, 224, 224, 3) and returns the
+    (N, 4) class scores, whatever runtime is underneath.
+    """
+
+    name = "base"
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+
+    @property
+    def weights(self):
+        """Keras-style weight list, used by the model registry for memory accounting."""
+        return []
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+class KerasBackend(InferenceBackend):
+    """Runs the original `.h5` model with TensorFlow/Keras."""
+
+    name = "keras"
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        import tensorflow as tf
+        self.model = tf.keras.models.load_model(model_path)
+
+    @property
+    def weights(self):
+        return self.model.weights
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+class OnnxBackend(InferenceBackend):
+    """Runs an exported ONNX model with ONNX Runtime on CPU."""
+
+    name = "onnx"
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend requires the onnxruntime package")
+
+        options = ort.SessionOptions()
+        if BACKEND_NUM_THREADS:
+            options.intra_op_num_threads = BACKEND_NUM_THREADS
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+class TFLiteBackend(InferenceBackend):
+    """
+    Runs an exported TFLite model, including quantized variants.
+
+    Resizing an interpreter's input reallocates all of its tensors, which
+    costs about as much as a small forward pass. Batches are therefore padded
+    to the next power of two and each of those sizes gets its own interpreter,
+    allocated once, so micro-batches of varying size never trigger a resize.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path):
+        super().__init__(model_path)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+            except ImportError:
+                raise ImportError("The tflite backend requires tflite-runtime or tensorflow")
+
+        self._interpreter_class = Interpreter
+        # Padded batch size -> (interpreter, lock); each interpreter is stateful
+        # and must not be invoked concurrently, but different sizes may run at once
+        self._interpreters = {}
+        self._interpreters_lock = threading.Lock()
+        interpreter, _ = self._interpreter(1)
+        self.input_detail = interpreter.get_input_details()[0]
+        self.output_detail = interpreter.get_output_details()[0]
+
+    @staticmethod
+    def padded_size(batch_size):
+        """Smallest power of two that holds `batch_size` images."""
+        return 1 << (max(1, batch_size) - 1).bit_length()
+
+    def _interpreter(self, size):
+        """Return the interpreter allocated for batches of `size`, creating it on first use."""
+        with self._interpreters_lock:
+            entry = self._interpreters.get(size)
+            if entry is None:
+                interpreter = self._interpreter_class(
+                    model_path=self.model_path,
+                    num_threads=BACKEND_NUM_THREADS or None
+                )
+                input_detail = interpreter.get_input_details()[0]
+                interpreter.resize_tensor_input(input_detail["index"], [size] + list(input_detail["shape"][1:]))
+                interpreter.allocate_tensors()
+                entry = self._interpreters[size] = (interpreter, threading.Lock())
+                logger.info(f"Allocated TFLite interpreter for batches of {size}")
+            return entry
+
+    def _quantize_input(self, batch):
+        dtype = self.input_detail["dtype"]
+        if dtype == np.float32:
+            return np.ascontiguousarray(batch, dtype=np.float32)
+        scale, zero_point = self.input_detail["quantization"]
+        info = np.iinfo(dtype)
+        quantized = np.round(batch / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    def _dequantize_output(self, output):
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self.output_detail["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        count = len(batch)
+        size = self.padded_size(count)
+        inputs = self._quantize_input(batch)
+        if size != count:
+            padded = np.zeros((size,) + inputs.shape[1:], dtype=inputs.dtype)
+            padded[:count] = inputs
+            inputs = padded
+
+        interpreter, lock = self._interpreter(size)
+        with lock:
+            interpreter.set_tensor(self.input_detail["index"], inputs)
+            interpreter.invoke()
+            output = interpreter.get_tensor(self.output_detail["index"])[:count]
+        return self._dequantize_output(output)
+
+# Longest side of the thumbnail the stub backend computes its statistics on
+STUB_THUMBNAIL_SIZE = 32
+
+def stub_scores(img):
+    """
+    Deterministic class scores for one image from cheap pixel statistics.
+
+    Works on a uint8 image of any size or on a normalized float32 model
+    input. Statistics are taken on a strided thumbnail, so the cost does not
+    grow with the input resolution and nothing is copied or re-decoded.
+    """
+    step = max(1, max(img.shape[0], img.shape[1]) // STUB_THUMBNAIL_SIZE)
+    thumbnail = img[::step, ::step]
+    scale = 255.0 if thumbnail.dtype.kind == "f" else 1.0
+    avg_value = float(thumbnail.mean()) * scale
+    std_value = float(thumbnail.std()) * scale
+
+    # Similar images get similar predictions, with a realistic class mix
+    value = (avg_value * 0.7 + std_value * 0.3) % 100
+    if value < 30:
+        class_index = 0  # Meningioma (30% chance)
+    elif value < 55:
+        class_index = 1  # Glioma (25% chance)
+    elif value < 75:
+        class_index = 2  # Pituitary (20% chance)
+    else:
+        class_index = 3  # No tumor (25% chance)
+
+    # Spread top-class scores across both sides of the 0.7 display threshold
+    confidence = 0.55 + 0.44 * ((value * 7.919) % 1.0)
+    scores = np.full(4, (1.0 - confidence) / 3, dtype=np.float32)
+    scores[class_index] = confidence
+    return scores
+
+class StubBackend(InferenceBackend):
+    """
+    Deterministic stand-in used when no model is available.
+
+    It takes the same preprocessed batches as the real backends, so staging
+    and load tests exercise the real decode, resize and batching pipeline
+    and only the forward pass is replaced.
+    """
+
+    name = "stub"
+
+    def __init__(self, model_path=None):
+        super().__init__(model_path)
+
+    def predict(self, batch):
+        return np.stack([stub_scores(img) for img in batch]) if len(batch) else np.empty((0, 4), dtype=np.float32)
+
+BACKENDS = {
+    KerasBackend.name: KerasBackend,
+    OnnxBackend.name: OnnxBackend,
+    TFLiteBackend.name: TFLiteBackend,
+    StubBackend.name: StubBackend
+}
+
+def backend_model_path(kind, keras_path):
+    """Return the model file used by a backend, derived from the Keras path unless configured."""
+    if kind == "onnx":
+        return ONNX_MODEL_PATH or os.path.splitext(keras_path)[0] + ".onnx"
+    if kind == "tflite":
+        suffix = "" if MODEL_VARIANT == "float32" else f"_{MODEL_VARIANT}"
+        return TFLITE_MODEL_PATH or os.path.splitext(keras_path)[0] + f"{suffix}.tflite"
+    return keras_path
+
+def load_backend(keras_path, kind=INFERENCE_BACKEND):
+    """
+    Resolve a backend through the shared model registry
+
+    Args:
+        keras_path: Path to the original Keras model
+        kind: One of "keras", "onnx", "tflite" or "stub"
+
+    Returns:
+        The shared InferenceBackend instance
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {kind}")
+    if kind == StubBackend.name:
+        # Nothing to load or share
+        return StubBackend()
+    return model_registry.get(backend_model_path(kind, keras_path), loader=BACKENDS[kind])
+
+def check_parity(candidate, reference, batch=None, tolerance=PARITY_TOLERANCE):
+    """
+    Compare a backend's output against a reference backend on the same batch
+
+    Args:
+        candidate: Backend under test
+        reference: Backend treated as ground truth (normally Keras)
+        batch: Input batch; a fixed pseudo-random batch is used if omitted
+        tolerance: Largest acceptable absolute difference in class scores
+
+    Returns:
+        Dictionary with the maximum difference, top-class agreement and verdict
+    """
+    if batch is None:
+        batch = np.random.RandomState(0).uniform(0.0, 1.0, (4, 224, 224, 3)).astype(np.float32)
+
+    expected = np.asarray(reference.predict(batch), dtype=np.float32)
+    actual = np.asarray(candidate.predict(batch), dtype=np.float32)
+
+    max_abs_diff = float(np.max(np.abs(expected - actual)))
+    argmax_agreement = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+
+    return {
+        "backend": candidate.name,
+        "reference": reference.name,
+        "max_abs_diff": max_abs_diff,
+        "argmax_agreement": argmax_agreement,
+        "tolerance": tolerance,
+        "passed": max_abs_diff <= tolerance and argmax_agreement == 1.0
+    }
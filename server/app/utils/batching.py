@@ -0,0 +1,290 @@
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.utils.cache import prediction_cache, image_cache_key, upload_cache_key
+from app.utils.executor import inference_executor, ExecutorSaturatedError
+from app.utils.singleflight import SingleFlight
+from app.utils.metrics import Histogram, BATCH_SIZE_BUCKETS, LATENCY_MS_BUCKETS, registry, timed
+from app.utils.prediction import (
+    model_available,
+    model_version,
+    decode_image,
+    resize_image,
+    predict_images,
+    format_prediction,
+    dummy_prediction
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+MAX_BATCH_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 16))
+MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 10))
+
+class BatchingEngine:
+    """
+    Collects concurrent inference requests into micro-batches.
+
+    Requests are queued until either `max_batch_size` images are waiting or
+    `max_wait_ms` has passed since the first one arrived, then `predict_fn` is
+    called once on `executor` with the list of queued items and each caller
+    gets back its own row of the output.
+    """
+
+    def __init__(self, predict_fn, executor, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = None
+        self._worker = None
+
+        # Histograms used to tune the batching window
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_latency_histogram = Histogram(LATENCY_MS_BUCKETS)
+        self.inference_latency_histogram = Histogram(LATENCY_MS_BUCKETS)
+
+    def _ensure_started(self):
+        """Start the collector task on the running event loop if needed."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, image):
+        """
+        Queue a single image and wait for its raw class scores
+
+        Args:
+            image: One batch item in the form `predict_fn` expects
+
+        Returns:
+            The model output row for this image
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future, time.perf_counter()))
+        return await future
+
+    async def stop(self):
+        """Cancel the collector task and fail anything still queued."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batching engine stopped"))
+
+    async def _collect(self):
+        """Wait for the first request, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        items = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            # Take whatever is already waiting without paying for a timer
+            if not self._queue.empty():
+                items.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._collect()
+
+            # Drop requests whose callers have already gone away
+            items = [item for item in items if not item[1].done()]
+            if not items:
+                continue
+
+            started = time.perf_counter()
+            for _, _, enqueued in items:
+                self.queue_latency_histogram.observe((started - enqueued) * 1000)
+            self.batch_size_histogram.observe(len(items))
+
+            try:
+                images = [image for image, _, _ in items]
+                predictions = await self.executor.run(self.predict_fn, images, bounded=False)
+            except Exception as e:
+                logger.error(f"Error running batch of {len(items)}: {str(e)}")
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self.inference_latency_histogram.observe((time.perf_counter() - started) * 1000)
+
+            for index, (_, future, _) in enumerate(items):
+                if not future.done():
+                    future.set_result(predictions[index])
+
+    def stats(self):
+        """Return the batching configuration and histograms."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_latency_ms": self.queue_latency_histogram.snapshot(),
+            "inference_latency_ms": self.inference_latency_histogram.snapshot()
+        }
+
+# Shared engine and request coalescing for the inference routes
+engine = BatchingEngine(predict_images, inference_executor)
+inflight = SingleFlight()
+
+# Pipeline metrics; children are resolved once so the hot path skips the label lookup
+stage_latency = registry.histogram("stage_duration_ms", "Wall time of each inference pipeline stage in milliseconds")
+prediction_counter = registry.counter("predictions", "Predictions served, by predicted class")
+fallback_counter = registry.counter("dummy_fallbacks", "Predictions answered by the stub model instead of a real one, by reason")
+_decode_latency = stage_latency.labels(stage="decode")
+_resize_latency = stage_latency.labels(stage="resize")
+_predict_latency = stage_latency.labels(stage="predict")
+
+# Scrape-time views of the batching queue and coalescing for /metrics
+registry.gauge("batching_queued", "Images waiting to join a batched forward pass", lambda: engine.stats()["queued"])
+registry.gauge("coalesced_in_flight", "Distinct scans currently being predicted", lambda: inflight.stats()["in_flight"])
+registry.histogram("batch_size", "Images per batched forward pass").attach(engine.batch_size_histogram)
+batch_latency = registry.histogram("batch_latency_ms", "Batching queue wait and forward pass time in milliseconds")
+batch_latency.attach(engine.queue_latency_histogram, phase="queue")
+batch_latency.attach(engine.inference_latency_histogram, phase="inference")
+
+# Whether a real model is loaded, recorded when the model is loaded (None until then)
+_model_loaded = None
+
+async def check_model_available():
+    """Load the model on the inference executor and remember whether it is a real one."""
+    global _model_loaded
+    _model_loaded = await inference_executor.run(model_available, bounded=False)
+    return _model_loaded
+
+def lookup_upload(data):
+    """Return the upload cache key of encoded bytes and any result cached under it. Blocking."""
+    key = upload_cache_key(data, model_version())
+    cached = prediction_cache.get(key, count_miss=False)
+    if cached is None and prediction_cache.disk_enabled:
+        cached = prediction_cache.load(key, count_miss=False)
+    return key, cached
+
+def prepare_image(image):
+    """Decode an image and compute its prediction cache key."""
+    img = image if isinstance(image, np.ndarray) else decode_image(image)
+    return image_cache_key(img, model_version()), img
+
+async def predict_image_batched(image, on_decoded=None, on_resized=None, bounded=True):
+    """
+    Predict the tumor type from an image path or encoded buffer, sharing the
+    forward pass with concurrent requests.
+
+    Results are cached by upload bytes and by decoded pixel content (with
+    the model version); the byte key is checked first so a repeated upload
+    skips the decode. Identical scans in flight at the same time are
+    coalesced. All blocking
+    work runs on the inference executor; ExecutorSaturatedError is
+    propagated so the caller can shed load. `on_decoded`, if given, is
+    awaited with the decoded array so callers can reuse the decode, and
+    `on_resized` with the model input when this request resizes it (not
+    for cached or coalesced results). Callers that already limit their own
+    concurrency, like batch requests, pass `bounded=False` to queue for the
+    executor instead of being rejected.
+    """
+    result = await _predict(image, on_decoded, on_resized, bounded)
+    # Results loaded from the disk cache carry the class as a plain string
+    predicted = getattr(result["result"], "value", result["result"])
+    prediction_counter.labels(result=predicted).inc()
+    return result
+
+async def _fallback(image, reason, bounded=True):
+    """Answer with the stub model's scoring of what was already decoded, and count why."""
+    fallback_counter.labels(reason=reason).inc()
+    return await inference_executor.run(dummy_prediction, image, bounded=bounded)
+
+async def _predict(image, on_decoded=None, on_resized=None, bounded=True):
+    # A repeated upload is answered before decoding, unless the caller needs the decode
+    upload_key = None
+    if on_decoded is None and isinstance(image, (bytes, bytearray, memoryview)):
+        upload_key, cached = await run_in_threadpool(lookup_upload, image)
+        if cached is not None:
+            return cached
+
+    try:
+        with timed(_decode_latency, "decode"):
+            key, img = await inference_executor.run(prepare_image, image, bounded=bounded)
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error decoding image: {str(e)}")
+        return await _fallback(image, "decode_error", bounded)
+
+    if on_decoded is not None:
+        await on_decoded(img)
+
+    # Serve repeated scans without touching the model
+    cached = prediction_cache.get(key)
+    if cached is None and prediction_cache.disk_enabled:
+        cached = await run_in_threadpool(prediction_cache.load, key)
+    if cached is not None:
+        if upload_key is not None:
+            # Re-encoded copy of a known scan; answer its bytes directly next time
+            prediction_cache.put(upload_key, cached)
+        return cached
+
+    # Identical scans arriving together share one forward pass
+    return await inflight.do(key, lambda: _predict_uncached(key, img, on_resized, bounded, upload_key))
+
+async def _predict_uncached(key, img, on_resized=None, bounded=True, upload_key=None):
+    """Run a decoded image through the model (or stub) and cache the result."""
+    # The stub model runs through the same resize and batching path as a real one
+    if _model_loaded is False:
+        fallback_counter.labels(reason="model_unavailable").inc()
+
+    try:
+        with timed(_resize_latency, "resize"):
+            resized_img = await inference_executor.run(resize_image, img, bounded=bounded)
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error preprocessing image: {str(e)}")
+        return await _fallback(img, "preprocess_error", bounded)
+
+    if on_resized is not None:
+        await on_resized(resized_img)
+
+    try:
+        with timed(_predict_latency, "predict"):
+            predictions = await engine.submit(resized_img)
+    except ExecutorSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"Error making prediction: {str(e)}")
+        logger.info("Falling back to stub model")
+        return await _fallback(img, "predict_error", bounded)
+
+    result = format_prediction(predictions)
+    for cache_key in (key, upload_key):
+        if cache_key is None:
+            continue
+        prediction_cache.put(cache_key, result)
+        if prediction_cache.disk_enabled:
+            await run_in_threadpool(prediction_cache.store, cache_key, result)
+    return result
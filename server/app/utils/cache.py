@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from app.utils.metrics import registry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CACHE_MAX_ENTRIES = int(os.environ.get("PREDICTION_CACHE_SIZE", 1024))
+CACHE_TTL_SECONDS = float(os.environ.get("PREDICTION_CACHE_TTL", 3600))
+CACHE_DIR = os.environ.get("PREDICTION_CACHE_DIR", "")
+
+def image_cache_key(img, model_version):
+    """
+    Build a cache key from decoded pixel data and the model version.
+
+    Hashing the decoded array rather than the upload means the same scan
+    re-encoded with different metadata still hits the cache.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(model_version).encode("utf-8"))
+    digest.update(str(img.shape).encode("utf-8"))
+    digest.update(str(img.dtype).encode("utf-8"))
+    digest.update(memoryview(np.ascontiguousarray(img)).cast("B"))
+    return digest.hexdigest()
+
+def upload_cache_key(data, model_version):
+    """
+    Build a cache key from the raw upload bytes and the model version.
+
+    It is looked up before decoding, so a repeated upload is answered without
+    paying for the decode; re-encoded copies of a scan miss here and are
+    found by `image_cache_key` instead. Keys never collide with pixel keys.
+    """
+    digest = hashlib.blake2b(digest_size=20, person=b"upload")
+    digest.update(str(model_version).encode("utf-8"))
+    digest.update(memoryview(data).cast("B"))
+    return digest.hexdigest()
+
+class PredictionCache:
+    """
+    LRU cache of prediction results with an optional shared on-disk tier.
+
+    The in-memory tier is bounded by entry count and TTL. When `disk_dir` is
+    set, results are also written there as small JSON files sharded by key
+    prefix so several workers (or processes) can share them.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, disk_dir=CACHE_DIR):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.disk_dir = disk_dir or None
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def disk_enabled(self):
+        return self.disk_dir is not None
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds
+
+    def get(self, key, count_miss=True):
+        """
+        Look up a result in memory, returning None on a miss
+
+        Lookups that fall back to another key pass `count_miss=False`, so one
+        request is not counted as both a miss and a hit.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if not self._expired(stored_at):
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return dict(value)
+
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            # Only count a miss here when there is no disk tier to consult
+            if count_miss and not self.disk_enabled:
+                self._counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        """Store a result in memory, evicting the least recently used entry if full."""
+        if self.max_entries == 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (dict(value), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def load(self, key, count_miss=True):
+        """Look up a result in the disk tier and promote it to memory. Blocking."""
+        if not self.disk_enabled:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            if self.ttl_seconds > 0 and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                value = None
+            else:
+                with open(path, "r") as f:
+                    value = json.load(f)
+        except (OSError, ValueError):
+            value = None
+
+        if value is not None or count_miss:
+            with self._lock:
+                self._counters["disk_hits" if value is not None else "misses"] += 1
+
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def store(self, key, value):
+        """Write a result to the disk tier atomically. Blocking."""
+        if not self.disk_enabled:
+            return
+
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not write prediction cache entry {key}: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self):
+        """Drop every in-memory entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache size and hit/miss counters."""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+
+        lookups = counters["hits"] + counters["disk_hits"] + counters["misses"]
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "disk_dir": self.disk_dir,
+            **counters,
+            "hit_ratio": (counters["hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+        }
+
+# Shared cache for the inference routes
+prediction_cache = PredictionCache()
+registry.gauge("prediction_cache_entries", "Entries in the in-memory prediction cache", lambda: prediction_cache.stats()["size"])
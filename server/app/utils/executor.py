@@ -0,0 +1,105 @@
+import os
+import asyncio
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from app.utils.metrics import registry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+EXECUTOR_KIND = os.environ.get("INFERENCE_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 2))
+EXECUTOR_MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", 32))
+
+class ExecutorSaturatedError(Exception):
+    """Raised when the inference executor already has its maximum queue depth."""
+
+class InferenceExecutor:
+    """
+    Size-bounded executor for CPU-heavy inference work.
+
+    Work submitted through `run` is executed on a dedicated thread pool (or
+    process pool) so it never blocks the event loop. At most
+    `max_workers + max_queue` calls may be outstanding; beyond that `run`
+    fails fast with ExecutorSaturatedError instead of queueing unbounded work.
+    """
+
+    def __init__(self, kind=EXECUTOR_KIND, max_workers=EXECUTOR_WORKERS, max_queue=EXECUTOR_MAX_QUEUE):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        self.kind = kind
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = None
+        self._pending = 0
+        self._rejected = 0
+
+    def _get_pool(self):
+        """Create the underlying pool on first use."""
+        if self._pool is None:
+            logger.info(f"Starting {self.kind} inference executor with {self.max_workers} workers")
+            if self.kind == "process":
+                # Each worker process loads its own copy of the model on first use
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="inference"
+                )
+        return self._pool
+
+    @property
+    def pending(self):
+        """Number of calls that are running or waiting for a worker."""
+        return self._pending
+
+    async def run(self, fn, *args, bounded=True):
+        """
+        Run a blocking function on the executor
+
+        Args:
+            fn: Function to call; must be picklable when using a process pool
+            *args: Positional arguments for `fn`
+            bounded: Reject the call when the queue is full. Work that has
+                already been admitted (e.g. a collected batch) passes False.
+
+        Returns:
+            The return value of `fn`
+        """
+        if bounded and self._pending >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            raise ExecutorSaturatedError(
+                f"Inference queue is full ({self._pending} requests pending)"
+            )
+
+        # Only touched from the event loop thread, so no lock is needed
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), partial(fn, *args))
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait=False):
+        """Shut down the underlying pool."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def stats(self):
+        """Return executor configuration and current queue depth."""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "rejected": self._rejected
+        }
+
+# Shared executor for the inference routes
+inference_executor = InferenceExecutor()
+registry.gauge("executor_pending", "Tasks queued or running on the inference executor", lambda: inference_executor.stats()["pending"])
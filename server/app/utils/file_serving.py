@@ -0,0 +1,155 @@
+import os
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from fastapi import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CHUNK_SIZE = 256 * 1024
+# Stored scans never change, so clients may cache them forever; they are patient data, so shared caches may not
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+ZERO_COPY_EXTENSION = "http.response.zerocopysend"
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header against an ETag (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag[2:] == etag if tag.startswith("W/") else tag == etag for tag in candidates)
+
+def parse_range(range_header, size):
+    """
+    Parse a Range header for a file of `size` bytes
+
+    Returns:
+        (start, end) inclusive for a single satisfiable range, "unsatisfiable"
+        when it cannot be served, or None to ignore it and send the whole file
+        (unsupported units, malformed values or multiple ranges)
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        return None
+
+    first, _, last = spec.partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                return "unsatisfiable"
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+
+    if end is not None and start > end:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return start, size - 1 if end is None else min(end, size - 1)
+
+class ImmutableFileResponse(Response):
+    """
+    Serves a file that never changes, honouring conditional and range requests.
+
+    Answers If-None-Match / If-Modified-Since with 304 and a single byte range
+    (with If-Range) with 206. The body is handed to the server as a file
+    descriptor when it supports the ASGI zero-copy send extension (sendfile),
+    and streamed in chunks from a worker thread otherwise.
+    """
+
+    def __init__(self, path, request: Request, etag, media_type, stat_result=None, headers=None):
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        stat_result = stat_result or os.stat(path)
+        size = stat_result.st_size
+
+        self.init_headers({
+            "etag": etag,
+            "cache-control": IMMUTABLE_CACHE_CONTROL,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+            **(headers or {})
+        })
+
+        self.offset = 0
+        self.count = size
+        self.status_code = 200
+        self.send_body = request.method != "HEAD"
+
+        if self._not_modified(request, etag, stat_result):
+            self.status_code = 304
+            self.count = 0
+            self.send_body = False
+            return
+
+        # If-Range: only honour the range if the client's copy is this one
+        if_range = request.headers.get("if-range")
+        byte_range = parse_range(request.headers.get("range"), size) if not if_range or if_range == etag else None
+        if byte_range == "unsatisfiable":
+            self.status_code = 416
+            self.count = 0
+            self.send_body = False
+            self.headers["content-range"] = f"bytes */{size}"
+            self.headers["content-length"] = "0"
+            return
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.offset = start
+            self.count = end - start + 1
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        self.headers["content-type"] = media_type
+        self.headers["content-length"] = str(self.count)
+
+    @staticmethod
+    def _not_modified(request, etag, stat_result):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if ZERO_COPY_EXTENSION in scope.get("extensions", {}):
+            # The server copies file to socket in the kernel
+            with open(self.path, "rb") as f:
+                await send({"type": ZERO_COPY_EXTENSION, "file": f, "offset": self.offset, "count": self.count})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank underneath us; end the response rather than hang
+                logger.error(f"{self.path} ended {remaining} bytes early")
+                await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,213 @@
+import math
+import time
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app.utils.profiling import record_timing
+
+# Default bucket boundaries
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class Histogram:
+    """Fixed-bucket histogram that can be updated from any thread."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record a single observation."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Return cumulative bucket counts plus the running count and sum."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+            count = self._count
+
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+
+        return {
+            "buckets": cumulative,
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0
+        }
+
+@contextmanager
+def timed(histogram, stage=None):
+    """
+    Observe the wall time of the block, in milliseconds, on `histogram`
+
+    With `stage`, the duration is also added to the current request's
+    timings when they are being collected.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        histogram.observe(elapsed_ms)
+        if stage is not None:
+            record_timing(stage, elapsed_ms)
+
+class Counter:
+    """Monotonic counter that can be updated from any thread."""
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """Add `amount` to the counter."""
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+class MetricFamily:
+    """
+    A named metric and its children, one per combination of label values.
+
+    Children are plain `Counter` or `Histogram` objects, so the hot path only
+    pays for a dict lookup and the child's own lock.
+    """
+
+    def __init__(self, name, documentation, kind, factory):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self._factory = factory
+        self._children = OrderedDict()
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        """Return the child for these label values, creating it on first use."""
+        key = tuple(sorted(labels.items()))
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def attach(self, child, **labels):
+        """Expose an existing Counter or Histogram under these label values."""
+        with self._lock:
+            self._children[tuple(sorted(labels.items()))] = child
+        return child
+
+    def samples(self):
+        """Yield (suffix, labels, value) tuples for the text exposition."""
+        for key, child in list(self._children.items()):
+            labels = dict(key)
+            if self.kind == "counter":
+                yield "_total", labels, child.value
+                continue
+
+            snapshot = child.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                yield "_bucket", {**labels, "le": bound}, count
+            yield "_sum", labels, snapshot["sum"]
+            yield "_count", labels, snapshot["count"]
+
+class GaugeFamily:
+    """
+    Gauge whose value is read from a callback at scrape time.
+
+    The callback returns a number, or a list of (labels, value) pairs for a
+    labelled gauge, so nothing is recorded on the request path.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self._callback = callback
+
+    def samples(self):
+        value = self._callback()
+        if isinstance(value, (int, float)):
+            value = [({}, value)]
+        for labels, sample in value:
+            yield "", labels, sample
+
+def _format_value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+class MetricsRegistry:
+    """Collection of metric families rendered in the Prometheus text format."""
+
+    def __init__(self, namespace="cerebro"):
+        self.namespace = namespace
+        self._families = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _register(self, family):
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None:
+                return existing
+            self._families[family.name] = family
+            return family
+
+    def _name(self, name):
+        return f"{self.namespace}_{name}" if self.namespace else name
+
+    def counter(self, name, documentation):
+        """Return the counter family `name`, registering it if needed."""
+        return self._register(MetricFamily(self._name(name), documentation, "counter", Counter))
+
+    def histogram(self, name, documentation, buckets=LATENCY_MS_BUCKETS):
+        """Return the histogram family `name`, registering it if needed."""
+        return self._register(MetricFamily(self._name(name), documentation, "histogram", lambda: Histogram(buckets)))
+
+    def gauge(self, name, documentation, callback):
+        """Register a gauge read from `callback` at scrape time."""
+        return self._register(GaugeFamily(self._name(name), documentation, callback))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for family in list(self._families.values()):
+            try:
+                samples = list(family.samples())
+            except Exception:
+                # A broken gauge callback must not take the whole scrape down
+                continue
+            lines.append(f"# HELP {family.name} {family.documentation}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Shared registry exposed at /metrics
+registry = MetricsRegistry()
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from fastapi.concurrency import run_in_threadpool
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_REQUESTS = int(os.environ.get("PROFILE_MAX_REQUESTS", 100))
+
+# Stage durations of the current request, or None when nobody asked for them
+_request_timings = ContextVar("request_timings", default=None)
+
+@contextmanager
+def collect_timings():
+    """
+    Collect per-stage durations for the current request
+
+    Yields the dict that `record_timing` fills in, in milliseconds per stage.
+    Work started from this context (including tasks it spawns) records into it.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+def record_timing(stage, elapsed_ms):
+    """Add a stage duration to the current request's timings, if they are being collected."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + elapsed_ms
+
+def _folded_stack(frame):
+    """Render a frame's call stack root-first in the folded format used by flame graph tools."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack while the next N armed requests are running.
+
+    An administrator arms the profiler for a number of requests; the stacks of
+    all threads (event loop and inference workers alike) are sampled every
+    `interval_ms` while any of those requests is in flight. When the last one
+    finishes, the samples are written to `output_dir` as folded stacks that
+    flamegraph.pl, speedscope or py-spy's viewers can read.
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR, interval_ms=PROFILE_INTERVAL_MS):
+        self.output_dir = output_dir
+        self.interval = max(0.1, float(interval_ms)) / 1000.0
+
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._active = 0
+        self._profiled = 0
+        # The running sampler's thread, stop event and samples; None while idle
+        self._session = None
+        self._last_profile = None
+
+    def arm(self, requests):
+        """
+        Profile the next `requests` requests
+
+        Returns:
+            The number of requests that will be profiled
+        """
+        with self._lock:
+            self._remaining = max(0, min(int(requests), PROFILE_MAX_REQUESTS))
+            return self._remaining
+
+    @asynccontextmanager
+    async def profile_request(self):
+        """
+        Sample stacks for the duration of the block if the profiler is armed.
+        Stopping the sampler and writing the profile happen off the event loop.
+        """
+        with self._lock:
+            if self._remaining <= 0:
+                selected = False
+            else:
+                selected = True
+                self._remaining -= 1
+                self._active += 1
+                if self._session is None:
+                    stop, samples = threading.Event(), Counter()
+                    thread = threading.Thread(
+                        target=self._sample, args=(stop, samples), name="request-profiler", daemon=True
+                    )
+                    self._session = (thread, stop, samples)
+                    thread.start()
+
+        if not selected:
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._profiled += 1
+                session = None
+                if self._active == 0 and self._remaining == 0:
+                    # Detach the finished session; requests armed later start a new one
+                    session, self._session = self._session, None
+                    profiled, self._profiled = self._profiled, 0
+
+            if session is not None:
+                await run_in_threadpool(self._finish, session, profiled)
+
+    def _sample(self, stop, samples):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = f"{names.get(thread_id, thread_id)};{_folded_stack(frame)}"
+                samples[stack] += 1
+
+    def _finish(self, session, profiled):
+        """Stop a session's sampler thread and write its samples."""
+        thread, stop, samples = session
+        stop.set()
+        thread.join()
+        if samples:
+            self._write(samples, profiled)
+
+    def _write(self, samples, profiled):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{profiled}req.folded")
+        try:
+            with open(path, "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error(f"Error writing profile {path}: {str(e)}")
+            return
+
+        self._last_profile = path
+        logger.info(f"Wrote profile of {profiled} requests to {path}")
+
+    def stats(self):
+        return {
+            "armed_requests": self._remaining,
+            "active_requests": self._active,
+            "interval_ms": self.interval * 1000,
+            "output_dir": self.output_dir,
+            "last_profile": self._last_profile
+        }
+
+# Shared profiler for the inference routes
+profiler = SamplingProfiler()
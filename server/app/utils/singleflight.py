@@ -0,0 +1,49 @@
+import asyncio
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the work as its own task; callers that
+    arrive while it is running await the same task instead of repeating it.
+    The task is shielded, so a caller that disconnects does not cancel the
+    work for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    async def do(self, key, fn):
+        """
+        Run `fn()` once for all concurrent callers with the same key
+
+        Args:
+            key: Identity of the work, e.g. an image content hash
+            fn: Coroutine function producing the result
+
+        Returns:
+            The shared result of `fn()`
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self._leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self._coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "executed": self._leaders,
+            "coalesced": self._coalesced
+        }
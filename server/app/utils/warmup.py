@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+
+from app.utils.backends import INFERENCE_BACKEND, check_parity, load_backend
+from app.utils.batching import MAX_BATCH_SIZE, check_model_available
+from app.utils.executor import inference_executor
+from app.utils.prediction import IMAGE_SIZE, MODEL_PATH, load_model, model_available, predict_images
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+WARMUP_ROUNDS = int(os.environ.get("WARMUP_ROUNDS", 2))
+WARMUP_BATCH_SIZES = [
+    int(size) for size in os.environ.get("WARMUP_BATCH_SIZES", f"1,{MAX_BATCH_SIZE}").split(",")
+    if size.strip()
+]
+BACKEND_PARITY_CHECK = os.environ.get("BACKEND_PARITY_CHECK", "false").lower() in ("1", "true", "yes")
+
+class ReadinessState:
+    """Tracks startup progress so the readiness probe can gate traffic."""
+
+    def __init__(self):
+        self.phase = "starting"
+        self.error = None
+        self.warmup = {}
+        self.parity = None
+        self.ready_at = None
+
+    @property
+    def ready(self):
+        return self.phase == "ready"
+
+    def to_dict(self):
+        return {
+            "status": "ready" if self.ready else "not_ready",
+            "phase": self.phase,
+            "error": self.error,
+            "warmup_ms": self.warmup,
+            "parity": self.parity,
+            "ready_at": self.ready_at
+        }
+
+readiness = ReadinessState()
+
+def warm_up_model(batch_sizes=WARMUP_BATCH_SIZES, rounds=WARMUP_ROUNDS):
+    """
+    Run synthetic batches through the model so graph tracing happens before real traffic.
+
+    Returns the duration in milliseconds of each round per batch size.
+    """
+    if not model_available():
+        logger.info("Skipping warm-up for stub model")
+        return {}
+
+    timings = {}
+    for batch_size in batch_sizes:
+        # Goes through the same path as real batches, preallocating the batch buffer too
+        images = [np.zeros((IMAGE_SIZE[1], IMAGE_SIZE[0], 3), dtype=np.uint8)] * batch_size
+        durations = []
+        for _ in range(max(1, rounds)):
+            started = time.perf_counter()
+            predict_images(images)
+            durations.append(round((time.perf_counter() - started) * 1000, 2))
+        timings[str(batch_size)] = durations
+        logger.info(f"Warm-up batch size {batch_size}: {durations} ms")
+    return timings
+
+def run_parity_check():
+    """Compare the configured backend against the Keras model, if both are available."""
+    if INFERENCE_BACKEND == "keras" or not model_available() or not os.path.exists(MODEL_PATH):
+        return None
+    return check_parity(load_model(), load_backend(MODEL_PATH, kind="keras"))
+
+async def run_startup_warmup():
+    """Load and warm the model on the inference executor, then mark the service ready."""
+    try:
+        readiness.phase = "loading"
+        await check_model_available()
+
+        if BACKEND_PARITY_CHECK:
+            readiness.phase = "checking_parity"
+            readiness.parity = await inference_executor.run(run_parity_check, bounded=False)
+            if readiness.parity is not None and not readiness.parity["passed"]:
+                raise RuntimeError(f"Backend parity check failed: {readiness.parity}")
+
+        readiness.phase = "warming"
+        # A process pool has one model per worker, so warm each of them
+        workers = inference_executor.max_workers if inference_executor.kind == "process" else 1
+        results = await asyncio.gather(*[
+            inference_executor.run(warm_up_model, bounded=False) for _ in range(workers)
+        ])
+
+        readiness.warmup = results[0]
+        readiness.ready_at = time.time()
+        readiness.phase = "ready"
+        logger.info("Inference service is ready")
+    except Exception as e:
+        logger.error(f"Model warm-up failed: {str(e)}")
+        readiness.error = str(e)
+        readiness.phase = "failed"
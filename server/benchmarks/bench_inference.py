@@ -0,0 +1,259 @@
+"""
+Inference benchmark: throughput and tail latency of preprocessing, the model and the HTTP path.
+
+Runs offline on the stub model by default, with synthetic MRI-like images.
+Run from the server directory:
+
+    python -m benchmarks.bench_inference --output results.json
+    python -m benchmarks.bench_inference --model ../model.h5 --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import subprocess
+
+import numpy as np
+
+from benchmarks.synthetic import FORMATS, synthetic_uploads
+
+def parse_ints(value):
+    return [int(item) for item in value.split(",") if item]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stages", default="preprocess,model,http", help="Comma-separated stages to run")
+    parser.add_argument("--resolutions", type=parse_ints, default=[256, 512, 1024])
+    parser.add_argument("--formats", default="jpg,png", help=f"Comma-separated subset of {','.join(FORMATS)}")
+    parser.add_argument("--batch-sizes", type=parse_ints, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--concurrency", type=parse_ints, default=[1, 2, 4, 8, 16])
+    parser.add_argument("--iterations", type=int, default=20, help="Timed batches per preprocess/model case")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per HTTP case")
+    parser.add_argument("--model", help="Benchmark this model file instead of the stub model")
+    parser.add_argument("--url", help="Benchmark a running service instead of an in-process app")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare throughput against")
+    return parser.parse_args()
+
+def configure_environment(args):
+    """Point the service at the requested model before any app module is imported."""
+    os.environ["MODEL_PATH"] = args.model or os.path.join(os.path.dirname(__file__), "no-model.h5")
+    # Distinct images already defeat the cache; this keeps disk caching out of the numbers too
+    os.environ["PREDICTION_CACHE_SIZE"] = "0"
+    os.environ["PREDICTION_CACHE_DIR"] = ""
+    os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+
+def summarize(latencies_ms, images, elapsed_seconds):
+    """Throughput and latency percentiles for one benchmark case."""
+    latencies = np.asarray(latencies_ms)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "images": images,
+        "images_per_sec": images / elapsed_seconds if elapsed_seconds else 0.0,
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(latencies.max())
+    }
+
+def time_batches(fn, batches):
+    """Call `fn` on each batch and return per-batch latencies and the total time."""
+    fn(batches[0])  # warm up
+    latencies = []
+    started = time.perf_counter()
+    for batch in batches:
+        call_started = time.perf_counter()
+        fn(batch)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    return latencies, time.perf_counter() - started
+
+def bench_local(args, uploads):
+    """Preprocessing and model stages, called directly at each batch size."""
+    from app.utils.prediction import BatchBuffer, decode_image, resize_image, predict_images
+
+    stages = args.stages.split(",")
+    results = []
+
+    for (resolution, fmt), encoded in uploads.items():
+        decoded = [decode_image(data) for data in encoded]
+        resized = [resize_image(img) for img in decoded]
+
+        for batch_size in args.batch_sizes:
+            # Cycle through the image pool so every batch has the requested size
+            batches = [
+                [index % len(encoded) for index in range(start, start + batch_size)]
+                for start in range(0, args.iterations * batch_size, batch_size)
+            ]
+            case = {"resolution": resolution, "format": fmt, "batch_size": batch_size}
+
+            if "preprocess" in stages:
+                buffer = BatchBuffer(batch_size)
+
+                def preprocess(indices):
+                    buffer.fill([resize_image(decode_image(encoded[i])) for i in indices])
+
+                latencies, elapsed = time_batches(preprocess, batches)
+                results.append({"stage": "preprocess", **case, **summarize(latencies, len(batches) * batch_size, elapsed)})
+
+            if "model" in stages:
+                # Without a model file this is the stub backend
+                def model(indices):
+                    predict_images([resized[i] for i in indices])
+
+                latencies, elapsed = time_batches(model, batches)
+                results.append({"stage": "model", **case, **summarize(latencies, len(batches) * batch_size, elapsed)})
+
+    return results
+
+async def _drive_http(client, url, encoded, content_type, concurrency, total):
+    """Send `total` uploads with `concurrency` in flight; return latencies, errors and elapsed time."""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total:
+            data = encoded[next_index % len(encoded)]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, files={"file": ("scan", data, content_type)})
+                if response.status_code != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+async def bench_http(args, uploads):
+    """End-to-end /api/inference/analyze requests at each concurrency level."""
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        from main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+
+    results = []
+    async with client:
+        for (resolution, fmt), encoded in uploads.items():
+            # Warm up the executor, batching engine and model
+            await _drive_http(client, "/api/inference/analyze", encoded, FORMATS[fmt], 1, 2)
+
+            for concurrency in args.concurrency:
+                latencies, errors, elapsed = await _drive_http(
+                    client, "/api/inference/analyze", encoded, FORMATS[fmt], concurrency, args.requests
+                )
+                results.append({
+                    "stage": "http",
+                    "resolution": resolution,
+                    "format": fmt,
+                    "concurrency": concurrency,
+                    "errors": errors,
+                    **summarize(latencies, args.requests - errors, elapsed)
+                })
+    return results
+
+def environment_info(args):
+    """Describe what was measured, so result files can be compared across commits and backends."""
+    from app.utils.backends import INFERENCE_BACKEND, MODEL_VARIANT
+    from app.utils.batching import MAX_BATCH_SIZE, MAX_WAIT_MS
+    from app.utils.executor import inference_executor
+    from app.utils.prediction import model_version
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import cv2
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "backend": INFERENCE_BACKEND,
+        "model_variant": MODEL_VARIANT or None,
+        "model_version": model_version(),
+        "executor": inference_executor.stats(),
+        "batching": {"max_batch_size": MAX_BATCH_SIZE, "max_wait_ms": MAX_WAIT_MS},
+        "target": args.url or "in-process",
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def case_key(result):
+    return (result["stage"], result["resolution"], result["format"], result.get("batch_size"), result.get("concurrency"))
+
+def print_summary(results, baseline=None):
+    """Print a human-readable table to stderr, with the speedup over `baseline` when given."""
+    previous = {case_key(result): result for result in (baseline or {}).get("results", [])}
+    header = f"{'stage':<11}{'res':>6}{'fmt':>5}{'batch':>6}{'conc':>5}{'img/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    if previous:
+        header += f"{'vs base':>9}"
+    print(header, file=sys.stderr)
+
+    for result in results:
+        line = (
+            f"{result['stage']:<11}{result['resolution']:>6}{result['format']:>5}"
+            f"{result.get('batch_size', '-'):>6}{result.get('concurrency', '-'):>5}"
+            f"{result['images_per_sec']:>10.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}"
+        )
+        before = previous.get(case_key(result))
+        if before and before["images_per_sec"]:
+            line += f"{result['images_per_sec'] / before['images_per_sec']:>8.2f}x"
+        print(line, file=sys.stderr)
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+
+    formats = args.formats.split(",")
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise SystemExit(f"Unknown formats: {', '.join(sorted(unknown))}")
+
+    # A pool per case large enough that consecutive requests never repeat an image
+    pool_size = max(args.batch_sizes + args.concurrency)
+    uploads = {
+        (resolution, fmt): synthetic_uploads(pool_size, resolution, fmt, seed=resolution)
+        for resolution in args.resolutions
+        for fmt in formats
+    }
+
+    stages = args.stages.split(",")
+    results = []
+    if "preprocess" in stages or "model" in stages:
+        results.extend(bench_local(args, uploads))
+    if "http" in stages:
+        results.extend(asyncio.run(bench_http(args, uploads)))
+
+    report = {"environment": environment_info(args), "results": results}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark: original preprocess_image vs. the preallocated float32 pipeline.
+
+Run from the server directory:
+
+    python -m benchmarks.bench_preprocess --iterations 500 --batch-size 16
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from app.utils.prediction import IMAGE_SIZE, BatchBuffer, resize_image
+
+def legacy_preprocess(img):
+    """The preprocessing used before the preallocated pipeline, minus decoding."""
+    img = cv2.resize(img, (224, 224))
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = img / 255.0
+    return np.expand_dims(img, axis=0)
+
+def legacy_batch(images):
+    # Keras converted the float64 batch to float32 internally
+    return np.concatenate([legacy_preprocess(img) for img in images]).astype(np.float32)
+
+def buffered_batch(images, buffer):
+    return buffer.fill([resize_image(img) for img in images])
+
+def measure(fn, iterations):
+    """Return mean milliseconds per call and peak bytes allocated during one call."""
+    fn()  # warm up
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed_ms = (time.perf_counter() - started) * 1000 / iterations
+
+    # NumPy reports its buffers to tracemalloc, so this covers the array allocations
+    tracemalloc.start()
+    fn()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed_ms, peak_bytes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--resolution", type=int, default=512, help="Side length of the synthetic input images")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(0)
+    images = [
+        rng.randint(0, 256, (args.resolution, args.resolution, 3), dtype=np.uint8)
+        for _ in range(args.batch_size)
+    ]
+    buffer = BatchBuffer(args.batch_size)
+
+    legacy = measure(lambda: legacy_batch(images), args.iterations)
+    buffered = measure(lambda: buffered_batch(images, buffer), args.iterations)
+
+    # Both pipelines must feed the model the same values
+    max_diff = float(np.max(np.abs(legacy_batch(images) - buffered_batch(images, buffer))))
+
+    print(f"batch of {args.batch_size} x {args.resolution}px -> {IMAGE_SIZE[0]}px, {args.iterations} iterations")
+    print(f"{'pipeline':<12}{'ms/batch':>12}{'peak MB allocated':>20}")
+    for name, (ms, peak_bytes) in (("legacy", legacy), ("buffered", buffered)):
+        print(f"{name:<12}{ms:>12.3f}{peak_bytes / (1024*1024):>20.2f}")
+    print(f"speedup: {legacy[0] / buffered[0]:.2f}x, max abs difference: {max_diff:.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+HTTP load test: boots the ML service locally and drives it with a mixed workload.
+
+The service runs under uvicorn with an in-memory MongoDB and, when TensorFlow
+is installed, a small generated Keras model (the stub model otherwise).
+Concurrency ramps through the given levels; each level reports throughput,
+tail latency and error rates per request kind. Run from the server directory:
+
+    python -m benchmarks.loadtest --ramp 1,8,32 --duration 20 --output load.json
+    python -m benchmarks.loadtest --workers 2 --env BATCH_MAX_WAIT_MS=5 --env INFERENCE_WORKERS=4
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import secrets
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from benchmarks.synthetic import FORMATS, synthetic_uploads
+
+# (weight, name, kind, resolution, format, images per request)
+WORKLOAD = [
+    (45, "analyze_small", "analyze", 256, "jpg", 1),
+    (25, "analyze_medium", "analyze", 512, "jpg", 1),
+    (10, "analyze_large", "analyze", 1024, "png", 1),
+    (5, "analyze_persist", "persist", 512, "jpg", 1),
+    (10, "analyze_batch", "batch", 256, "jpg", 8),
+    (5, "stats", "stats", None, None, 0)
+]
+POOL_SIZE = 32
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ramp", default="1,4,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per concurrency level")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, help="Port for the local service (default: a free port)")
+    parser.add_argument("--model", help="Serve this model file instead of generating one")
+    parser.add_argument("--stub", action="store_true", help="Serve the stub model even if TensorFlow is installed")
+    parser.add_argument("--url", help="Load an already running service instead of booting one")
+    parser.add_argument("--token", help="Administrator bearer token for /api/inference/stats when using --url")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the service, e.g. INFERENCE_WORKERS=4")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here")
+    return parser.parse_args()
+
+def generate_model(directory):
+    """Save a tiny Keras classifier with the production input and output shapes."""
+    import tensorflow as tf
+
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(224, 224, 3)),
+        tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(4, activation="softmax")
+    ])
+    path = os.path.join(directory, "loadtest_model.h5")
+    model.save(path)
+    return path
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def admin_token(secret, admin_id):
+    """Sign a short-lived token for the load-test administrator, as the Node backend would."""
+    from jose import jwt
+    return jwt.encode({"sub": admin_id, "exp": int(time.time()) + 24 * 3600}, secret, algorithm="HS256")
+
+def start_service(args, workdir):
+    """Start uvicorn in a subprocess and return (process, base_url, admin token)."""
+    env = dict(os.environ)
+    if args.model:
+        env["MODEL_PATH"] = os.path.abspath(args.model)
+    elif not args.stub and importlib.util.find_spec("tensorflow") is not None:
+        env["MODEL_PATH"] = generate_model(workdir)
+    else:
+        env["MODEL_PATH"] = os.path.join(workdir, "no-model.h5")
+
+    env.update({
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "BLOB_STORE_DIR": os.path.join(workdir, "blobs"),
+        "PREDICTION_CACHE_DIR": "",
+        "RATE_LIMIT_PER_SECOND": "0",
+        "MONGODB_URI": "memory://loadtest",
+        "JWT_SECRET": secrets.token_hex(32)
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    port = args.port or free_port()
+    server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "benchmarks.loadtest_server:app",
+            "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"
+        ],
+        cwd=server_dir,
+        env=env
+    )
+    token = admin_token(env["JWT_SECRET"], env.get("LOADTEST_ADMIN_ID", "000000000000000000000001"))
+    return process, f"http://127.0.0.1:{port}", token
+
+async def wait_until_ready(client, process=None, timeout=300):
+    """Poll /api/ready until the model is warmed up."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode}")
+        try:
+            response = await client.get("/api/ready")
+            if response.status_code == 200:
+                return response.json()
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Service was not ready within {timeout}s")
+
+def build_pools(seed):
+    """Distinct encoded images per (resolution, format) used by the workload."""
+    pools = {}
+    for _, _, _, resolution, fmt, _ in WORKLOAD:
+        if resolution and (resolution, fmt) not in pools:
+            pools[(resolution, fmt)] = synthetic_uploads(POOL_SIZE, resolution, fmt, seed=seed + resolution)
+    return pools
+
+async def send(client, entry, pools, rng):
+    """Issue one request of the given workload entry and return (status code, images)."""
+    _, name, kind, resolution, fmt, images = entry
+    if kind == "stats":
+        response = await client.get("/api/inference/stats")
+        return response.status_code, 0
+
+    pool = pools[(resolution, fmt)]
+    content_type = FORMATS[fmt]
+    if kind == "batch":
+        files = [("files", (f"scan{i}.{fmt}", rng.choice(pool), content_type)) for i in range(images)]
+        response = await client.post("/api/inference/analyze/batch", files=files)
+    else:
+        params = {"persist": "true"} if kind == "persist" else None
+        files = {"file": (f"scan.{fmt}", rng.choice(pool), content_type)}
+        response = await client.post("/api/inference/analyze", files=files, params=params)
+    return response.status_code, images
+
+async def run_level(client, concurrency, duration, pools, rng):
+    """Keep `concurrency` requests in flight for `duration` seconds."""
+    weights = [entry[0] for entry in WORKLOAD]
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    images_done = 0
+    deadline = time.monotonic() + duration
+
+    async def user():
+        nonlocal images_done
+        while time.monotonic() < deadline:
+            entry = rng.choices(WORKLOAD, weights)[0]
+            started = time.perf_counter()
+            try:
+                status_code, images = await send(client, entry, pools, rng)
+            except Exception as e:
+                status_code, images = type(e).__name__, 0
+            latencies[entry[1]].append((time.perf_counter() - started) * 1000)
+            statuses[entry[1]][str(status_code)] += 1
+            if status_code == 200:
+                images_done += images
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    kinds = {}
+    for name, values in latencies.items():
+        values = np.asarray(values)
+        total = sum(statuses[name].values())
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        kinds[name] = {
+            "requests": total,
+            "error_rate": 1 - statuses[name].get("200", 0) / total,
+            "status_codes": dict(statuses[name]),
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(values.max())
+        }
+
+    all_latencies = np.concatenate([np.asarray(values) for values in latencies.values()])
+    total_requests = len(all_latencies)
+    errors = sum(sum(counts.values()) - counts.get("200", 0) for counts in statuses.values())
+    p50, p95, p99 = np.percentile(all_latencies, [50, 95, 99])
+    return {
+        "concurrency": concurrency,
+        "duration_seconds": elapsed,
+        "requests": total_requests,
+        "requests_per_sec": total_requests / elapsed,
+        "images_per_sec": images_done / elapsed,
+        "error_rate": errors / total_requests if total_requests else 0.0,
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "kinds": kinds
+    }
+
+def print_level(level):
+    print(
+        f"concurrency {level['concurrency']:>4}: {level['requests_per_sec']:>8.1f} req/s "
+        f"{level['images_per_sec']:>8.1f} img/s  p50 {level['p50_ms']:>8.1f} ms  "
+        f"p95 {level['p95_ms']:>8.1f} ms  p99 {level['p99_ms']:>8.1f} ms  errors {level['error_rate']:.1%}",
+        file=sys.stderr
+    )
+    for name, kind in sorted(level["kinds"].items()):
+        print(
+            f"    {name:<16}{kind['requests']:>7} req  p50 {kind['p50_ms']:>8.1f}  p99 {kind['p99_ms']:>8.1f}  "
+            f"errors {kind['error_rate']:.1%}  {kind['status_codes']}",
+            file=sys.stderr
+        )
+
+async def run(args, base_url, process=None, token=None):
+    import httpx
+
+    pools = build_pools(args.seed)
+    rng = random.Random(args.seed)
+    levels = [int(level) for level in args.ramp.split(",") if level]
+
+    limits = httpx.Limits(max_connections=max(levels) * 2)
+    # /stats is admin-only; the token is sent with every request and ignored elsewhere
+    headers = {"Authorization": f"Bearer {token}"} if token else None
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits, headers=headers) as client:
+        readiness = await wait_until_ready(client, process)
+        results = []
+        for concurrency in levels:
+            level = await run_level(client, concurrency, args.duration, pools, rng)
+            print_level(level)
+            results.append(level)
+
+        response = await client.get("/api/inference/stats")
+        stats = response.json() if response.status_code == 200 else None
+
+    return {
+        "target": base_url,
+        "workers": args.workers,
+        "service_env": args.env,
+        "readiness": readiness,
+        "levels": results,
+        "service_stats": stats
+    }
+
+def main():
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="cerebro-loadtest-") as workdir:
+        process = None
+        if args.url:
+            base_url, token = args.url, args.token
+        else:
+            process, base_url, token = start_service(args, workdir)
+
+        try:
+            report = asyncio.run(run(args, base_url, process, token))
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+ASGI entry point for load tests: `main:app` backed by an in-memory MongoDB.
+
+Started by benchmarks.loadtest, or by hand from the server directory:
+
+    uvicorn benchmarks.loadtest_server:app --port 6100
+"""
+import os
+import itertools
+from datetime import datetime
+
+from bson import ObjectId
+
+import app.database as database
+
+# Administrator the load test authenticates as for the admin-only endpoints
+LOADTEST_ADMIN_ID = os.environ.get("LOADTEST_ADMIN_ID", "000000000000000000000001")
+
+def _matches(document, query):
+    return all(document.get(field) == value for field, value in query.items())
+
+class InMemoryCollection:
+    """The subset of the Motor collection API the ML service uses, kept in a list."""
+
+    def __init__(self, name):
+        self.name = name
+        self.documents = []
+        self.indexes = {"_id_": {"key": [("_id", 1)]}}
+        self._counter = itertools.count()
+
+    async def create_index(self, keys, unique=False, **kwargs):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.indexes[name] = {"key": keys, "unique": unique}
+        return name
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def insert_one(self, document):
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+        return type("InsertOneResult", (), {"inserted_id": document["_id"]})()
+
+    async def find_one(self, query=None):
+        return next((dict(doc) for doc in self.documents if _matches(doc, query or {})), None)
+
+    async def delete_one(self, query):
+        for index, doc in enumerate(self.documents):
+            if _matches(doc, query):
+                del self.documents[index]
+                return type("DeleteResult", (), {"deleted_count": 1})()
+        return type("DeleteResult", (), {"deleted_count": 0})()
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.documents if _matches(doc, query))
+
+async def init_in_memory_db():
+    database.client = None
+    database.db = {name: InMemoryCollection(name) for name in ("users", "analyses", "scans")}
+    database.users_collection = database.db["users"]
+    database.analyses_collection = database.db["analyses"]
+    database.scans_collection = database.db["scans"]
+    await database.ensure_indexes()
+    await database.users_collection.insert_one({
+        "_id": ObjectId(LOADTEST_ADMIN_ID),
+        "name": "Load test",
+        "email": "loadtest@example.com",
+        "role": "admin",
+        "hashed_password": "",
+        "created_at": datetime.utcnow()
+    })
+
+async def close_in_memory_db():
+    database.db = database.users_collection = database.analyses_collection = database.scans_collection = None
+
+# Swap the database hooks before main imports them
+database.init_db = init_in_memory_db
+database.close_db = close_in_memory_db
+
+from main import app  # noqa: E402
@@ -0,0 +1,55 @@
+"""
+Synthetic MRI-like test images for the benchmarks and load tests.
+
+Each image is an axial-slice lookalike: a dark background, a bright skull
+ring, textured grey matter and an optional bright lesion, so codecs and
+the preprocessing see realistic structure instead of uniform noise.
+"""
+import cv2
+import numpy as np
+
+# Formats understood by cv2.imencode and the upload content types they map to
+FORMATS = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "bmp": "image/bmp",
+    "webp": "image/webp"
+}
+
+def synthetic_mri(resolution, rng):
+    """Return a BGR uint8 image of `resolution` x `resolution` pixels."""
+    size = int(resolution)
+    center = (size // 2 + rng.randint(-size // 20, size // 20 + 1), size // 2)
+    axes = (int(size * rng.uniform(0.30, 0.38)), int(size * rng.uniform(0.38, 0.45)))
+
+    img = np.zeros((size, size), dtype=np.uint8)
+    cv2.ellipse(img, center, axes, 0, 0, 360, 200, thickness=max(2, size // 40))
+    cv2.ellipse(img, center, (axes[0] - size // 30, axes[1] - size // 30), 0, 0, 360, 110, thickness=-1)
+
+    # Low-frequency texture for the tissue, plus scanner noise everywhere
+    texture = cv2.resize(rng.randint(0, 60, (16, 16)).astype(np.uint8), (size, size), interpolation=cv2.INTER_CUBIC)
+    img = cv2.add(img, cv2.bitwise_and(texture, texture, mask=(img > 0).astype(np.uint8)))
+    noise = rng.normal(0, 6, img.shape)
+    img = np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+    if rng.rand() < 0.75:
+        lesion_center = (
+            center[0] + rng.randint(-axes[0] // 2, axes[0] // 2 + 1),
+            center[1] + rng.randint(-axes[1] // 2, axes[1] // 2 + 1)
+        )
+        cv2.circle(img, lesion_center, max(2, int(size * rng.uniform(0.03, 0.08))), 235, thickness=-1)
+
+    img = cv2.GaussianBlur(img, (3, 3), 0)
+    return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+def encode_image(img, fmt):
+    """Encode a BGR image in one of FORMATS and return the file bytes."""
+    ok, encoded = cv2.imencode(f".{fmt}", img)
+    if not ok:
+        raise ValueError(f"Could not encode image as {fmt}")
+    return encoded.tobytes()
+
+def synthetic_uploads(count, resolution, fmt, seed=0):
+    """Return `count` distinct encoded images, so caching and coalescing never kick in."""
+    rng = np.random.RandomState(seed)
+    return [encode_image(synthetic_mri(resolution, rng), fmt) for _ in range(count)]
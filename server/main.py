@@ -1,16 +1,23 @@
 import os
+import asyncio
 import uvicorn
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 
-from app.routes import analysis
-from app.database import init_db
-
-# Load environment variables
+# Load environment variables before importing app modules, which read their settings at import time
 load_dotenv(".env.fastapi")
 
+from app.routes import analysis, analyses, scans
+from app.database import init_db, close_db
+from app.utils.batching import engine
+from app.utils.executor import inference_executor
+from app.utils.metrics import registry
+from app.utils.warmup import readiness, run_startup_warmup
+from app.services.job_queue import job_queue
+from app.services.maintenance import upload_sweeper
+
 # Create FastAPI app
 app = FastAPI(
     title="CereBro AI ML Service",
@@ -31,20 +38,60 @@ app.add_middleware(
 upload_dir = os.environ.get("UPLOAD_DIR", "uploads/mri-scans")
 os.makedirs(upload_dir, exist_ok=True)
 
-# Mount static files directory for serving uploaded images
-app.mount("/uploads", StaticFiles(directory=upload_dir), name="uploads")
-
 # Include only the analysis router
 app.include_router(analysis.router, prefix="/api/inference", tags=["Inference"])
+# Stored scans and their thumbnails, served with immutable caching and range support
+app.include_router(scans.router, prefix="/api/scans", tags=["Scans"])
+app.include_router(scans.uploads_router, prefix="/uploads")
+# Persisted analyses processed by the background job queue
+app.include_router(analyses.router, prefix="/api/analyses", tags=["Analyses"])
 
 @app.on_event("startup")
 async def startup_db_client():
     await init_db()
 
+@app.on_event("startup")
+async def startup_job_recovery():
+    # Jobs do not survive a restart; fail the analyses the previous process left unfinished
+    await job_queue.recover()
+
+@app.on_event("startup")
+async def startup_model_warmup():
+    # Warm up in the background so liveness checks keep answering meanwhile
+    app.state.warmup_task = asyncio.create_task(run_startup_warmup())
+
+@app.on_event("startup")
+async def startup_upload_sweeper():
+    # Reclaims temp files left in the blob store by interrupted writes
+    upload_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown_inference_engine():
+    await upload_sweeper.stop()
+    await job_queue.stop()
+    await engine.stop()
+    inference_executor.shutdown()
+
+@app.on_event("shutdown")
+async def shutdown_db_client():
+    # Registered after the hooks above, so the sweeper and job workers have stopped using it
+    await close_db()
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "message": "CereBro AI ML Service is running"}
 
+@app.get("/api/ready")
+async def readiness_check():
+    # Only report ready once the model is loaded and warmed up
+    status_code = status.HTTP_200_OK if readiness.ready else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=status_code, content=readiness.to_dict())
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus text exposition of the pipeline stage, queue and memory metrics
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 6000))
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file